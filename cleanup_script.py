@@ -1,18 +1,23 @@
 #!/usr/bin/env python3
 """
 Standalone cleanup script for the Auto-Delete Telegram Bot.
-This script can be run via cron every 12 hours to delete expired messages.
+Deletes expired messages once, for use while the bot is stopped; the running bot
+sweeps them itself, so do not schedule this script next to it.
 """
 
 import asyncio
 import sys
 import os
 
-from telegram import Bot
+from telegram.ext import ExtBot
+from telegram.request import HTTPXRequest
 
 import config
 from database import MessageDatabase
-from utils import setup_logging, delete_message_notify
+from utils import (
+    setup_logging, create_rate_limiter, get_notify_user, purge_expired_messages, wait_for_notifications,
+    CONNECTION_POOL_SIZE
+)
 
 # Add the current directory to Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -22,36 +27,32 @@ logger = setup_logging()
 
 async def cleanup_expired_messages():
     """Clean up expired messages from the channel"""
+    db = None
     try:
         # Initialize bot and database
-        bot = Bot(token=config.BOT_TOKEN)
-        db = MessageDatabase(config.DATABASE_PATH)
-
-        # Get messages that need to be deleted
-        messages_to_delete = db.get_messages_to_delete()
-
-        if not messages_to_delete:
-            logger.info("No messages to delete at this time")
-            return
-
-        deleted_count = 0
-        failed_count = 0
-
-        logger.info("Found %s messages to delete", len(messages_to_delete))
+        bot = ExtBot(
+            token=config.BOT_TOKEN,
+            request=HTTPXRequest(connection_pool_size=CONNECTION_POOL_SIZE),
+            rate_limiter=create_rate_limiter()
+        )
+        db = await asyncio.to_thread(MessageDatabase, config.DATABASE_PATH)
 
-        for message_id, chat_id, record_id in messages_to_delete:
-            success, _ = await delete_message_notify(
-                bot, db, message_id, chat_id, record_id
-            )
+        notify_user = get_notify_user()
+        if notify_user is None:
+            logger.warning("No user configured for deletion notifications")
 
-            if success:
-                deleted_count += 1
-            else:
-                failed_count += 1
-                # If message deletion fails, keep the record for retry
+        # Delete expired messages over one shared keep-alive connection pool
+        async with bot:
+            deleted_count, failed_count = await purge_expired_messages(bot, db, notify_user=notify_user)
+            # Deliver the summary before the bot's connections are closed
+            await wait_for_notifications()
 
         # Clean up old database records
-        cleanup_count = db.cleanup_old_records()
+        cleanup_count = await asyncio.to_thread(db.cleanup_old_records)
+
+        # Keep query plans fresh and the file compact after large deletions
+        await asyncio.to_thread(db.optimize)
+        await asyncio.to_thread(db.vacuum_if_due)
 
         logger.info(
             "Cleanup completed: %s messages deleted, %s failed, %s old records cleaned",
@@ -61,6 +62,9 @@ async def cleanup_expired_messages():
     except Exception as e:
         logger.error("Error during cleanup: %s", e)
         sys.exit(1)
+    finally:
+        if db is not None:
+            await asyncio.to_thread(db.close)
 
 def main():
     """Main function to run the cleanup"""
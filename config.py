@@ -1,24 +1,59 @@
 import os
+from types import SimpleNamespace
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-# Bot configuration
-BOT_TOKEN = os.getenv('BOT_TOKEN')
-CHANNEL_ID = os.getenv('CHANNEL_ID')  # Your channel ID where messages will be deleted
 
-# User notification configuration
-USER_ID = os.getenv('USER_ID')  # Your Telegram user ID for deletion notifications
-USER_USERNAME = os.getenv('USER_USERNAME')  # Your Telegram username (alternative to USER_ID)
+def _parse_chat_id(value):
+    """Return a numeric chat ID as int, keeping non-numeric values such as @usernames as is"""
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return value
 
-# Database configuration
-DATABASE_PATH = 'messages.db'
 
-# Message deletion settings
-DELETE_AFTER_MINUTES = int(os.getenv('DELETE_AFTER_MINUTES', '86400'))  # 60 days in minutes
-CHECK_INTERVAL_MINUTES = int(os.getenv('CHECK_INTERVAL_MINUTES', '720'))  # 12 hours = 720 minutes
+def load_config(env=os.environ):
+    """Parse the bot configuration from a mapping of environment variables"""
+    return SimpleNamespace(
+        # Bot configuration
+        BOT_TOKEN=env.get('BOT_TOKEN'),
+        CHANNEL_ID=env.get('CHANNEL_ID'),  # Your channel ID where messages will be deleted
+        CHANNEL_ID_INT=_parse_chat_id(env.get('CHANNEL_ID')),  # Parsed once so forwarded chat IDs compare as ints
 
-# Logging configuration
-LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
-LOG_FILE = os.getenv('LOG_FILE', 'bot.log')
+        # User notification configuration
+        USER_ID=env.get('USER_ID'),  # Your Telegram user ID for deletion notifications
+        USER_USERNAME=env.get('USER_USERNAME'),  # Your Telegram username (alternative to USER_ID)
+
+        # Database configuration
+        DATABASE_PATH='messages.db',
+
+        # Message deletion settings
+        DELETE_AFTER_MINUTES=int(env.get('DELETE_AFTER_MINUTES', '86400')),  # 60 days in minutes
+        CHECK_INTERVAL_MINUTES=int(env.get('CHECK_INTERVAL_MINUTES', '720')),  # 12 hours = 720 minutes
+
+        # Logging configuration
+        LOG_LEVEL=env.get('LOG_LEVEL', 'INFO'),
+        LOG_FILE=env.get('LOG_FILE', 'bot.log'),
+        LOG_MAX_BYTES=int(env.get('LOG_MAX_BYTES', '10485760')),  # 10 MB per log file
+        LOG_BACKUP_COUNT=int(env.get('LOG_BACKUP_COUNT', '5')),
+    )
+
+
+_cfg = load_config()
+
+BOT_TOKEN = _cfg.BOT_TOKEN
+CHANNEL_ID = _cfg.CHANNEL_ID
+CHANNEL_ID_INT = _cfg.CHANNEL_ID_INT
+USER_ID = _cfg.USER_ID
+USER_USERNAME = _cfg.USER_USERNAME
+DATABASE_PATH = _cfg.DATABASE_PATH
+DELETE_AFTER_MINUTES = _cfg.DELETE_AFTER_MINUTES
+CHECK_INTERVAL_MINUTES = _cfg.CHECK_INTERVAL_MINUTES
+LOG_LEVEL = _cfg.LOG_LEVEL
+LOG_FILE = _cfg.LOG_FILE
+LOG_MAX_BYTES = _cfg.LOG_MAX_BYTES
+LOG_BACKUP_COUNT = _cfg.LOG_BACKUP_COUNT
@@ -1,8 +1,64 @@
 import sqlite3
 import datetime
-from typing import List, Tuple
+import threading
+import time
+from typing import Iterator, List, Optional, Tuple
 import logging
 
+# Bumped whenever init_database() has to migrate existing data
+SCHEMA_VERSION = 2
+
+# Clustered on (delete_date, id) so expired messages sit contiguously at the start of the table
+_CREATE_MESSAGES_SQL = '''
+    CREATE TABLE IF NOT EXISTS {table} (
+        delete_date INTEGER NOT NULL,
+        id INTEGER NOT NULL,
+        message_id INTEGER NOT NULL,
+        chat_id INTEGER NOT NULL,
+        forward_date INTEGER NOT NULL,
+        created_at INTEGER NOT NULL DEFAULT (unixepoch()),
+        PRIMARY KEY (delete_date, id)
+    ) WITHOUT ROWID
+'''
+
+# Hot-path statements, kept as constants so the connection's statement cache reuses them
+_INSERT_SQL = '''
+    INSERT INTO messages (id, message_id, chat_id, forward_date, delete_date)
+    VALUES (?, ?, ?, ?, ?)
+    RETURNING id, delete_date
+'''
+# Ids come from a counter that never goes backwards, so deleting the newest records cannot
+# hand their ids out again; the first allocation continues from the existing records
+_NEXT_ID_SQL = '''
+    INSERT INTO sequences (name, value)
+    VALUES ('messages', (SELECT IFNULL(MAX(id), 0) + 1 FROM messages))
+    ON CONFLICT (name) DO UPDATE SET value = value + 1
+    RETURNING value
+'''
+# Keyset paging over the primary key; (delete_date, id) of the previous page's last row is bound
+_SELECT_EXPIRED_PAGE_SQL = '''
+    SELECT message_id, chat_id, id, delete_date FROM messages
+    WHERE (delete_date, id) > (?, ?) AND delete_date <= ? AND message_id IS NOT NULL
+    ORDER BY delete_date, id
+    LIMIT ?
+'''
+_COUNT_SQL = 'SELECT COUNT(*), COUNT(*) FILTER (WHERE delete_date <= ?) FROM messages'
+_DELETE_BY_ID_SQL = 'DELETE FROM messages WHERE id = ?'
+_DELETE_BY_KEY_SQL = 'DELETE FROM messages WHERE delete_date = ? AND id = ?'
+# Only records already past expiry are purged, a range at the start of the clustered key
+_DELETE_OLD_SQL = 'DELETE FROM messages WHERE delete_date <= ?'
+_SELECT_LAST_RUN_SQL = 'SELECT last_run FROM maintenance WHERE name = ?'
+_RECORD_RUN_SQL = 'INSERT OR REPLACE INTO maintenance (name, last_run) VALUES (?, ?)'
+
+
+def _to_epoch(value, assume_utc: bool = False) -> int:
+    """Convert a legacy ISO-8601 timestamp string to unix seconds"""
+    parsed = datetime.datetime.fromisoformat(value)
+    if assume_utc and parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return int(parsed.timestamp())
+
+
 class MessageDatabase:
     """Database manager for storing and managing messages scheduled for deletion.
     
@@ -10,87 +66,256 @@ class MessageDatabase:
     retrieving messages to delete, and cleaning up old records.
     """
     def __init__(self, db_path: str):
+        import config
         self.db_path = db_path
+        self._conn = None
+        # Retention period, read from config once
+        self._delete_after_seconds = config.DELETE_AFTER_MINUTES * 60
+        # sqlite3 connections must not be used by several threads at once
+        self._lock = threading.Lock()
         self.init_database()
 
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection configured for WAL journaling and a large page cache"""
+        # file: URIs allow shared in-memory databases such as file:name?mode=memory&cache=shared
+        conn = sqlite3.connect(
+            self.db_path, isolation_level=None, check_same_thread=False, cached_statements=128,
+            uri=self.db_path.startswith('file:')
+        )
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute('PRAGMA cache_size=-64000')
+        conn.execute('PRAGMA mmap_size=30000000000')
+        return conn
+
+    def _connection(self) -> sqlite3.Connection:
+        """Return the persistent connection, opening it on first use"""
+        if self._conn is None:
+            self._conn = self._connect()
+        return self._conn
+
+    def close(self):
+        """Close the persistent database connection"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
     def init_database(self):
         """Initialize the database with required tables"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._lock, self._connection() as conn:
                 cursor = conn.cursor()
+                cursor.execute('BEGIN IMMEDIATE')
+                exists = cursor.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages'"
+                ).fetchone()
+                version = cursor.execute('PRAGMA user_version').fetchone()[0]
+                if exists and version < 1:
+                    self._migrate_timestamps(cursor)
+                if exists and version < 2:
+                    self._rebuild_without_rowid(cursor)
+                cursor.execute(_CREATE_MESSAGES_SQL.format(table='messages'))
+                # Secondary key for deleting records by id
+                cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_id ON messages(id)')
+                # Old records are purged by delete_date, so created_at needs no index
+                cursor.execute('DROP INDEX IF EXISTS idx_messages_created_at')
                 cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS messages (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        message_id INTEGER NOT NULL,
-                        chat_id INTEGER NOT NULL,
-                        forward_date TIMESTAMP NOT NULL,
-                        delete_date TIMESTAMP NOT NULL,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    CREATE TABLE IF NOT EXISTS maintenance (
+                        name TEXT PRIMARY KEY,
+                        last_run INTEGER NOT NULL
                     )
                 ''')
-                conn.commit()
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS sequences (
+                        name TEXT PRIMARY KEY,
+                        value INTEGER NOT NULL
+                    )
+                ''')
+                if version < SCHEMA_VERSION:
+                    cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+                # Refresh planner statistics; analysis_limit keeps this cheap on large tables
+                cursor.execute('PRAGMA analysis_limit=400')
+                cursor.execute('ANALYZE')
                 logging.info("Database initialized successfully")
         except Exception as e:
             logging.error("Error initializing database: %s", e)
 
-    def add_message(self, message_id: int, chat_id: int, forward_date: datetime.datetime):
-        """Add a new message to the database"""
+    @staticmethod
+    def _migrate_timestamps(cursor: sqlite3.Cursor):
+        """Convert timestamps stored as text by older versions to unix seconds"""
+        cursor.execute('''
+            SELECT id, forward_date, delete_date, created_at FROM messages
+            WHERE typeof(delete_date) = 'text' OR typeof(created_at) = 'text'
+        ''')
+        rows = [
+            # forward/delete dates were written as local or tz-aware datetimes,
+            # created_at by CURRENT_TIMESTAMP which is UTC
+            (_to_epoch(forward_date), _to_epoch(delete_date), _to_epoch(created_at, assume_utc=True), record_id)
+            for record_id, forward_date, delete_date, created_at in cursor.fetchall()
+        ]
+        cursor.executemany(
+            'UPDATE messages SET forward_date = ?, delete_date = ?, created_at = ? WHERE id = ?', rows
+        )
+        if rows:
+            logging.info("Migrated %s message records to integer timestamps", len(rows))
+
+    @staticmethod
+    def _rebuild_without_rowid(cursor: sqlite3.Cursor):
+        """Copy records from the old rowid table into the clustered WITHOUT ROWID layout"""
+        cursor.execute(_CREATE_MESSAGES_SQL.format(table='messages_new'))
+        cursor.execute('''
+            INSERT INTO messages_new (delete_date, id, message_id, chat_id, forward_date, created_at)
+            SELECT delete_date, id, message_id, chat_id, forward_date, COALESCE(created_at, unixepoch())
+            FROM messages
+        ''')
+        cursor.execute('DROP TABLE messages')
+        cursor.execute('ALTER TABLE messages_new RENAME TO messages')
+        logging.info("Rebuilt messages table as WITHOUT ROWID")
+
+    def add_message(
+        self, message_id: int, chat_id: int, forward_date: datetime.datetime
+    ) -> Optional[Tuple[int, int]]:
+        """Add a new message to the database.
+
+        Returns (record_id, delete_date) as stored, with delete_date in unix seconds, or None on failure.
+        """
         try:
-            import config
-            delete_date = forward_date + datetime.timedelta(minutes=config.DELETE_AFTER_MINUTES)
-            with sqlite3.connect(self.db_path) as conn:
+            forward_ts = int(forward_date.timestamp())
+            delete_date = forward_ts + self._delete_after_seconds
+            with self._lock, self._connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT INTO messages (message_id, chat_id, forward_date, delete_date)
-                    VALUES (?, ?, ?, ?)
-                ''', (message_id, chat_id, forward_date, delete_date))
-                conn.commit()
-                logging.info("Message %s added to database, will be deleted on %s", message_id, delete_date)
-                return True
+                cursor.execute('BEGIN IMMEDIATE')
+                record_id = cursor.execute(_NEXT_ID_SQL).fetchone()[0]
+                cursor.execute(_INSERT_SQL, (record_id, message_id, chat_id, forward_ts, delete_date))
+                record = cursor.fetchone()
+                logging.info(
+                    "Message %s added to database, will be deleted on %s",
+                    message_id, datetime.datetime.fromtimestamp(record[1])
+                )
+                return record
         except Exception as e:
             logging.error("Error adding message to database: %s", e)
-            return False
+            return None
 
     def get_messages_to_delete(self) -> List[Tuple[int, int, int]]:
-        """Get all messages that should be deleted (message_id, chat_id, message_id)"""
+        """Get all expired messages (message_id, chat_id, id) as one list
+
+        Test and debugging helper; the purge pages through iter_messages_to_delete() instead.
+        """
+        return [row for page in self.iter_messages_to_delete() for row in page]
+
+    def iter_messages_to_delete(self, batch: int = 100) -> Iterator[List[Tuple[int, int, int]]]:
+        """Yield expired messages (message_id, chat_id, id) in pages of at most batch rows
+
+        Each page is a separate query that resumes after the last row of the previous one,
+        so rows deleted between pages do not shift the pages.
+        """
+        current_time = int(time.time())
+        last_key = (-1, -1)
+        while True:
+            try:
+                with self._lock, self._connection() as conn:
+                    rows = conn.execute(_SELECT_EXPIRED_PAGE_SQL, (*last_key, current_time, batch)).fetchall()
+            except Exception as e:
+                logging.error("Error getting messages to delete: %s", e)
+                return
+            if not rows:
+                return
+            yield [row[:3] for row in rows]
+            if len(rows) < batch:
+                return
+            last_key = (rows[-1][3], rows[-1][2])
+
+    def get_status_counts(self) -> Optional[Tuple[int, int]]:
+        """Get (total, pending deletion) message counts in a single query, or None on failure"""
         try:
-            current_time = datetime.datetime.now()
-            with sqlite3.connect(self.db_path) as conn:
+            current_time = int(time.time())
+            with self._lock, self._connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT message_id, chat_id, id FROM messages
-                    WHERE delete_date <= ? AND message_id IS NOT NULL
-                ''', (current_time,))
-                return cursor.fetchall()
+                cursor.execute(_COUNT_SQL, (current_time,))
+                return cursor.fetchone()
         except Exception as e:
-            logging.error("Error getting messages to delete: %s", e)
-            return []
+            logging.error("Error getting message counts: %s", e)
+            return None
+
+    def delete_message_record(self, record_id: int, delete_date: Optional[int] = None):
+        """Remove a message record from the database after deletion
 
-    def delete_message_record(self, record_id: int):
-        """Remove a message record from the database after deletion"""
+        With delete_date the record is matched on its full primary key. Returns False
+        when no record matched, e.g. because the sweep already removed it.
+        """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._lock, self._connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute('DELETE FROM messages WHERE id = ?', (record_id,))
-                conn.commit()
+                if delete_date is None:
+                    cursor.execute(_DELETE_BY_ID_SQL, (record_id,))
+                else:
+                    cursor.execute(_DELETE_BY_KEY_SQL, (delete_date, record_id))
+                if cursor.rowcount == 0:
+                    logging.info("Message record %s was already removed from database", record_id)
+                    return False
                 logging.info("Message record %s removed from database", record_id)
                 return True
         except Exception as e:
             logging.error("Error deleting message record: %s", e)
             return False
 
+    def delete_message_records(self, record_ids: List[int]):
+        """Remove several message records in a single transaction"""
+        try:
+            with self._lock, self._connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('BEGIN IMMEDIATE')
+                cursor.executemany(_DELETE_BY_ID_SQL, [(record_id,) for record_id in record_ids])
+                logging.info("%s message records removed from database", cursor.rowcount)
+                return True
+        except Exception as e:
+            logging.error("Error deleting message records: %s", e)
+            return False
+
     def cleanup_old_records(self, days: int = 7):
-        """Clean up old records that are older than specified days"""
+        """Clean up records that have been past their delete date for more than the specified days
+
+        Records still waiting for deletion are never removed, however long ago they were added.
+        """
         try:
-            cutoff_date = datetime.datetime.now() - datetime.timedelta(days=days)
-            with sqlite3.connect(self.db_path) as conn:
+            cutoff_date = int(time.time()) - days * 86400
+            with self._lock, self._connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute('DELETE FROM messages WHERE created_at < ?', (cutoff_date,))
+                cursor.execute('BEGIN IMMEDIATE')
+                cursor.execute(_DELETE_OLD_SQL, (cutoff_date,))
                 deleted_count = cursor.rowcount
-                conn.commit()
                 if deleted_count > 0:
                     logging.info("Cleaned up %s old records", deleted_count)
                 return deleted_count
         except Exception as e:
             logging.error("Error cleaning up old records: %s", e)
             return 0
+
+    def optimize(self):
+        """Refresh query planner statistics after large deletions"""
+        try:
+            with self._lock, self._connection() as conn:
+                conn.execute('PRAGMA optimize')
+                return True
+        except Exception as e:
+            logging.error("Error optimizing database: %s", e)
+            return False
+
+    def vacuum_if_due(self, interval_days: int = 30):
+        """Rebuild the database file to release free pages, at most once per interval"""
+        try:
+            current_time = int(time.time())
+            with self._lock, self._connection() as conn:
+                row = conn.execute(_SELECT_LAST_RUN_SQL, ('vacuum',)).fetchone()
+                if row is not None and current_time - row[0] < interval_days * 86400:
+                    return False
+                conn.execute('VACUUM')
+                conn.execute(_RECORD_RUN_SQL, ('vacuum', current_time))
+                logging.info("Database vacuumed")
+                return True
+        except Exception as e:
+            logging.error("Error vacuuming database: %s", e)
+            return False
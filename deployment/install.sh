@@ -227,7 +227,12 @@ install_systemd_services() {
     
     # Copy systemd service files
     cp "$INSTALL_DIR/deployment/systemd/"*.service /etc/systemd/system/
-    cp "$INSTALL_DIR/deployment/systemd/"*.timer /etc/systemd/system/
+
+    # The bot sweeps expired messages itself; retire the cleanup timer left by older installs
+    if systemctl is-enabled --quiet autodeletebot-cleanup.timer 2>/dev/null; then
+        systemctl disable --now autodeletebot-cleanup.timer
+    fi
+    rm -f /etc/systemd/system/autodeletebot-cleanup.service /etc/systemd/system/autodeletebot-cleanup.timer
     
     # Update service files with correct paths and Docker Compose command
     sed -i "s|/opt/autodeletebot|$INSTALL_DIR|g" /etc/systemd/system/autodeletebot*.service
@@ -247,7 +252,6 @@ install_systemd_services() {
     
     # Enable services
     systemctl enable autodeletebot.service
-    systemctl enable autodeletebot-cleanup.timer
     
     echo -e "${GREEN}✅ Systemd services installed and enabled${NC}"
 }
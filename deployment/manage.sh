@@ -30,7 +30,7 @@ show_usage() {
     echo "  status      - Show service status"
     echo "  logs        - Show service logs"
     echo "  logs-follow - Follow service logs"
-    echo "  cleanup     - Run cleanup manually"
+    echo "  cleanup     - Run cleanup manually while the bot is stopped"
     echo "  update      - Update bot image and restart"
     echo "  backup      - Backup bot data"
     echo "  restore     - Restore bot data from backup"
@@ -92,10 +92,6 @@ show_status() {
     echo -e "${BLUE}🐳 Docker Container Status${NC}"
     echo "=========================="
     docker ps --filter "name=autodeletebot" --format "table {{.Names}}\t{{.Status}}\t{{.Ports}}"
-    echo ""
-    echo -e "${BLUE}⏰ Timer Status${NC}"
-    echo "==============="
-    systemctl status autodeletebot-cleanup.timer --no-pager -l
 }
 
 # Function to show logs
@@ -116,14 +112,15 @@ follow_logs() {
 
 # Function to run cleanup manually
 run_cleanup() {
-    echo -e "${BLUE}🧹 Running cleanup manually...${NC}"
+    # The running bot sweeps expired messages itself; a second sweeper would delete and report them twice
     if check_service; then
-        docker exec autodeletebot python3 cleanup_script.py
-        echo -e "${GREEN}✅ Cleanup completed${NC}"
-    else
-        echo -e "${RED}❌ Service is not running. Start it first with: $0 start${NC}"
+        echo -e "${YELLOW}⚠️  The bot is running and deletes expired messages itself${NC}"
+        echo "Send /cleanup to the bot to sweep now, or stop it first with: $0 stop"
         exit 1
     fi
+    echo -e "${BLUE}🧹 Running cleanup manually...${NC}"
+    docker-compose -f "$COMPOSE_FILE" run --rm autodeletebot python3 cleanup_script.py
+    echo -e "${GREEN}✅ Cleanup completed${NC}"
 }
 
 # Function to update bot
@@ -12,8 +12,9 @@ def run_tests():
     """Run all tests and return results."""
     # Discover and run tests
     loader = unittest.TestLoader()
-    start_dir = os.path.join(os.path.dirname(__file__), 'tests')
-    suite = loader.discover(start_dir, pattern='test_*.py')
+    top_level_dir = os.path.dirname(os.path.abspath(__file__))
+    # Discovered as the tests package, so tests/__init__.py runs before the test modules
+    suite = loader.discover(os.path.join(top_level_dir, 'tests'), pattern='test_*.py', top_level_dir=top_level_dir)
 
     # Run tests
     runner = unittest.TextTestRunner(verbosity=2)
@@ -47,18 +47,6 @@ chmod +x cleanup_script.py
 echo "📝 Creating log file..."
 touch bot.log
 
-# Set up cron job
-echo "⏰ Setting up cron job for cleanup (every 12 hours)..."
-cron_job="0 */12 * * * cd $(pwd) && $(pwd)/venv/bin/python $(pwd)/cleanup_script.py >> $(pwd)/bot.log 2>&1"
-
-# Check if cron job already exists
-if crontab -l 2>/dev/null | grep -q "cleanup_script.py"; then
-    echo "✅ Cron job already exists"
-else
-    (crontab -l 2>/dev/null; echo "$cron_job") | crontab -
-    echo "✅ Cron job added"
-fi
-
 echo ""
 echo "🎉 Setup completed successfully!"
 echo ""
@@ -68,5 +56,6 @@ echo "2. Make your bot an admin in your channel with delete permissions"
 echo "3. Start the bot: python3 telegram_bot.py"
 echo "4. Forward messages from your channel to the bot"
 echo ""
-echo "The cleanup script will run automatically every 12 hours via cron"
+echo "The bot deletes expired messages itself every CHECK_INTERVAL_MINUTES (default 720)"
+echo "Run cleanup_script.py only for a one-off cleanup while the bot is stopped"
 echo "Check bot.log for any errors or issues"
@@ -1,13 +1,45 @@
+from __future__ import annotations
+
+import asyncio
 import datetime
-from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
+import time
+from typing import TYPE_CHECKING
 from database import MessageDatabase
-from utils import setup_logging, delete_message_notify
+from utils import (
+    setup_logging, create_rate_limiter, get_notify_user, purge_expired_messages,
+    wait_for_notifications, CONNECTION_POOL_SIZE
+)
 import config
 
+# python-telegram-bot is imported in run(), so importing this module stays cheap
+if TYPE_CHECKING:
+    from telegram import Update
+    from telegram.ext import Application, ContextTypes
+
 # Configure logging
 logger = setup_logging()
 
+# How long /status may serve cached message counts
+STATUS_CACHE_SECONDS = 30
+
+# /help reply, built once at import rather than on every command
+HELP_TEXT = """
+📚 <b>Auto-Delete Bot Help</b>
+
+<b>Commands:</b>
+/start - Start the bot
+/help - Show this help message
+/status - Show bot status and message count
+/cleanup - Delete expired messages now
+
+<b>How to use:</b>
+1. Forward any message from your Telegram channel to this bot
+2. The bot will automatically schedule it for deletion after 60 days
+3. Messages are checked every 12 hours and deleted when their time is up
+
+<b>Note:</b> The bot must be an admin in your channel with delete message permissions.
+"""
+
 class AutoDeleteBot:
     """Telegram bot for automatically deleting channel messages after a specified time.
     
@@ -17,6 +49,18 @@ class AutoDeleteBot:
     def __init__(self):
         self.db = MessageDatabase(config.DATABASE_PATH)
         self.application = None
+        # (monotonic time, (total, pending)) of the last /status query
+        self._status_cache = None
+        # Channel whose forwarded messages are tracked, read from config once
+        self._channel_id = config.CHANNEL_ID_INT
+        # Chat that receives deletion notifications, resolved once from config
+        self._notify_target = get_notify_user()
+        if self._notify_target is None:
+            logger.warning("No user configured for deletion notifications")
+        # Sweep started by start_sweep(); only one runs at a time
+        self._sweep_task = None
+        # Set when messages fall due during a sweep, so it runs once more
+        self._sweep_again = False
 
 
 
@@ -37,24 +81,8 @@ class AutoDeleteBot:
 
     async def help_command(self, update: Update, _context: ContextTypes.DEFAULT_TYPE):
         """Handle /help command"""
-        help_text = """
-📚 **Auto-Delete Bot Help**
-
-**Commands:**
-/start - Start the bot
-/help - Show this help message
-/status - Show bot status and message count
-/cleanup - Manually trigger cleanup of old records
-
-**How to use:**
-1. Forward any message from your Telegram channel to this bot
-2. The bot will automatically schedule it for deletion after 60 days
-3. Messages are checked every 12 hours and deleted when their time is up
-
-**Note:** The bot must be an admin in your channel with delete message permissions.
-        """
         try:
-            await update.message.reply_text(help_text, parse_mode='Markdown')
+            await update.message.reply_text(HELP_TEXT, parse_mode='HTML')
         except Exception as e:
             logger.error("Error in help command: %s", e)
 
@@ -62,40 +90,50 @@ class AutoDeleteBot:
         """Handle /status command"""
         try:
             # Get message count from database
-            with self.db.db_path as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT COUNT(*) FROM messages')
-                total_messages = cursor.fetchone()[0]
-
-                cursor.execute('SELECT COUNT(*) FROM messages WHERE delete_date <= ?',
-                            (datetime.datetime.now(),))
-                pending_deletion = cursor.fetchone()[0]
+            counts = await self.get_status_counts()
+            if counts is None:
+                await update.message.reply_text("❌ Error getting status. Check logs for details.")
+                return
+            total_messages, pending_deletion = counts
 
             status_text = f"""
-📊 **Bot Status**
+📊 <b>Bot Status</b>
 
-**Total messages tracked:** {total_messages}
-**Pending deletion:** {pending_deletion}
-**Next cleanup:** Every 12 hours
-**Deletion delay:** 60 days
+<b>Total messages tracked:</b> {total_messages}
+<b>Pending deletion:</b> {pending_deletion}
+<b>Next cleanup:</b> Every 12 hours
+<b>Deletion delay:</b> 60 days
 
 Bot is running and monitoring messages.
             """
-            await update.message.reply_text(status_text, parse_mode='Markdown')
+            await update.message.reply_text(status_text, parse_mode='HTML')
         except Exception as e:
             logger.error("Error getting status: %s", e)
             await update.message.reply_text("❌ Error getting status. Check logs for details.")
 
-    async def cleanup_command(self, update: Update, _context: ContextTypes.DEFAULT_TYPE):
-        """Handle /cleanup command - manual cleanup trigger"""
+    async def get_status_counts(self):
+        """Return (total, pending) message counts, cached for STATUS_CACHE_SECONDS"""
+        now = time.monotonic()
+        if self._status_cache is not None and now - self._status_cache[0] < STATUS_CACHE_SECONDS:
+            return self._status_cache[1]
+
+        counts = await asyncio.to_thread(self.db.get_status_counts)
+        if counts is not None:
+            self._status_cache = (now, counts)
+        return counts
+
+    async def cleanup_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /cleanup command - queue a deletion sweep in the background"""
         try:
-            deleted_count = self.db.cleanup_old_records()
-            await update.message.reply_text(f"🧹 Cleanup completed! Removed {deleted_count} old records.")
+            if self.start_sweep(context.application) is None:
+                await update.message.reply_text("🧹 Cleanup already running. Expired messages are being deleted.")
+                return
+            await update.message.reply_text("🧹 Cleanup queued! Expired messages will be deleted shortly.")
         except Exception as e:
-            logger.error("Error during manual cleanup: %s", e)
+            logger.error("Error queueing manual cleanup: %s", e)
             await update.message.reply_text("❌ Error during cleanup. Check logs for details.")
 
-    async def handle_forwarded_message(self, update: Update, _context: ContextTypes.DEFAULT_TYPE):
+    async def handle_forwarded_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle forwarded messages from the channel"""
         try:
             # Check if update has a message
@@ -103,34 +141,48 @@ Bot is running and monitoring messages.
                 logger.debug("Update or message is None, skipping")
                 return
 
+            from telegram import MessageOriginChannel
+
             message = update.message
 
-            # Check if this is a forwarded message
-            if not message.forward_from_chat:
-                logger.debug("Message is not forwarded, skipping")
+            # Only forwarded channel posts carry the original channel and message id
+            origin = message.forward_origin
+            if not isinstance(origin, MessageOriginChannel):
+                logger.debug("Message is not forwarded from a channel, skipping")
                 return
 
             # Check if it's from the configured channel
-            if str(message.forward_from_chat.id) != config.CHANNEL_ID:
-                logger.debug("Message not from configured channel: %s", message.forward_from_chat.id)
+            chat_id = origin.chat.id
+            if chat_id != self._channel_id:
+                logger.debug("Message not from configured channel: %s", chat_id)
                 return
 
             # Get the original message ID and forward date
-            original_message_id = message.forward_from_message_id
+            original_message_id = origin.message_id
             if not original_message_id:
                 logger.warning("Forwarded message missing message ID")
                 return
 
-            forward_date = message.forward_date or datetime.datetime.now()
+            forward_date = origin.date
 
             # Add to database for future deletion
-            if self.db.add_message(original_message_id, message.forward_from_chat.id, forward_date):
+            record = await asyncio.to_thread(self.db.add_message, original_message_id, chat_id, forward_date)
+            if record is not None:
+                _, delete_ts = record
                 await message.reply_text(
-                    f"✅ Message scheduled for deletion on {forward_date + datetime.timedelta(minutes=config.DELETE_AFTER_MINUTES)}"
+                    f"✅ Message scheduled for deletion on {datetime.datetime.fromtimestamp(delete_ts)}"
                 )
+
+                # Sweep right at expiry; forwards that expire in the same second share one job,
+                # and the periodic sweep catches jobs lost on restart
+                job_name = f"sweep-{delete_ts}"
+                if not context.job_queue.get_jobs_by_name(job_name):
+                    context.job_queue.run_once(
+                        self.delete_due_job, when=max(delete_ts - time.time(), 0), name=job_name
+                    )
                 logger.info(
                     "Message %s from channel %s scheduled for deletion",
-                    original_message_id, message.forward_from_chat.id
+                    original_message_id, chat_id
                 )
             else:
                 await message.reply_text("❌ Failed to schedule message for deletion.")
@@ -144,37 +196,90 @@ Bot is running and monitoring messages.
                 except Exception as reply_error:
                     logger.error("Failed to send error reply: %s", reply_error)
 
+    async def delete_due_job(self, context: ContextTypes.DEFAULT_TYPE):
+        """Sweep for expired messages when scheduled messages fall due"""
+        task = self.start_sweep(context.application)
+        if task is None:
+            # The running sweep may have read its pages before these messages expired
+            self._sweep_again = True
+            return
+        await task
+
+    def start_sweep(self, application: Application):
+        """Start a background sweep for expired messages; return its task, or None if one is already running"""
+        if self._sweep_task is not None and not self._sweep_task.done():
+            return None
+        self._sweep_task = application.create_task(self._sweep())
+        return self._sweep_task
+
+    async def _sweep(self):
+        """Delete expired messages, and once more if messages fell due meanwhile"""
+        await self.delete_expired_messages()
+        while self._sweep_again:
+            self._sweep_again = False
+            await self.delete_expired_messages()
+
     async def delete_expired_messages(self):
         """Delete all expired messages from the channel"""
         try:
-            messages_to_delete = self.db.get_messages_to_delete()
-            deleted_count = 0
-            failed_count = 0
-
-            for message_id, chat_id, record_id in messages_to_delete:
-                success, _ = await delete_message_notify(
-                    self.application.bot, self.db, message_id, chat_id, record_id
-                )
-
-                if success:
-                    deleted_count += 1
-                else:
-                    failed_count += 1
-                    # If message deletion fails, keep the record for retry
+            deleted_count, failed_count = await purge_expired_messages(
+                self.application.bot, self.db, notify_user=self._notify_target
+            )
 
             if deleted_count > 0:
                 logger.info("Cleanup completed: %s messages deleted, %s failed", deleted_count, failed_count)
+                # Refresh query planner statistics after the deletions
+                await asyncio.to_thread(self.db.optimize)
             else:
                 logger.info("No messages to delete at this time")
 
         except Exception as e:
             logger.error("Error during message deletion cleanup: %s", e)
 
+    async def delete_expired_job(self, context: ContextTypes.DEFAULT_TYPE):
+        """Periodic sweep for expired messages whose deletion job was missed"""
+        task = self.start_sweep(context.application)
+        if task is None:
+            logger.info("Cleanup already running, skipping the periodic sweep")
+            return
+        await task
+
+    async def cleanup_old_records_job(self, _context: ContextTypes.DEFAULT_TYPE):
+        """Periodically remove records that expired long ago from the database"""
+        try:
+            await asyncio.to_thread(self.db.cleanup_old_records)
+        except Exception as e:
+            logger.error("Error cleaning up old records: %s", e)
+
+    async def maintenance_job(self, _context: ContextTypes.DEFAULT_TYPE):
+        """Periodically compact the database file"""
+        await asyncio.to_thread(self.db.vacuum_if_due)
+
+    async def post_stop(self, _application: Application):
+        """Deliver pending notifications while the bot can still send them"""
+        await wait_for_notifications()
+
+    async def post_shutdown(self, _application: Application):
+        """Release the database connection when the bot stops"""
+        await asyncio.to_thread(self.db.close)
+
     def run(self):
         """Initialize and run the bot"""
+        from telegram import Update
+        from telegram.ext import Application, CommandHandler, MessageHandler, filters
+
         try:
             # Create application
-            self.application = Application.builder().token(config.BOT_TOKEN).build()
+            self.application = (
+                Application.builder()
+                .token(config.BOT_TOKEN)
+                .connection_pool_size(CONNECTION_POOL_SIZE)
+                .concurrent_updates(True)
+                .rate_limiter(create_rate_limiter())
+                .post_stop(self.post_stop)
+                .post_shutdown(self.post_shutdown)
+                .build()
+            )
 
             # Add handlers
             self.application.add_handler(CommandHandler("start", self.start_command))
@@ -182,12 +287,28 @@ Bot is running and monitoring messages.
             self.application.add_handler(CommandHandler("status", self.status_command))
             self.application.add_handler(CommandHandler("cleanup", self.cleanup_command))
             # Only handle forwarded messages, not all messages
-            self.application.add_handler(MessageHandler(filters.FORWARDED, self.handle_forwarded_message))
+            self.application.add_handler(
+                MessageHandler(filters.FORWARDED & ~filters.COMMAND, self.handle_forwarded_message)
+            )
+
+            # Sweep expired messages on the event loop; catches jobs lost on restart
+            self.application.job_queue.run_repeating(
+                self.delete_expired_job,
+                interval=datetime.timedelta(minutes=config.CHECK_INTERVAL_MINUTES),
+                first=60
+            )
+            # Old record cleanup runs in the background rather than in a command handler
+            self.application.job_queue.run_repeating(
+                self.cleanup_old_records_job,
+                interval=datetime.timedelta(minutes=config.CHECK_INTERVAL_MINUTES)
+            )
+            self.application.job_queue.run_repeating(self.maintenance_job, interval=datetime.timedelta(days=1))
 
             logger.info("Bot started successfully")
 
             # Start the bot
-            self.application.run_polling(allowed_updates=Update.ALL_TYPES)
+            # Commands and forwards are plain messages, so no other update types are requested
+            self.application.run_polling(allowed_updates=[Update.MESSAGE])
 
         except Exception as e:
             logger.error("Error starting bot: %s", e)
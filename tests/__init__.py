@@ -1 +1,6 @@
 # Tests package for Auto-Delete Telegram Bot
+import os
+
+# Imported by pytest and unittest discovery before any test module, so logging set up by the
+# code under test, also at import, discards records instead of writing bot.log
+os.environ['AUTODELETE_TEST_MODE'] = '1'
@@ -0,0 +1,37 @@
+"""Pytest configuration for the Auto-Delete Telegram Bot tests."""
+
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+# Make the bot modules importable from the tests, once for the whole session
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# RAM-backed directory for temporary test files; set AUTODELETE_TESTS_NO_TMPFS=1 to use the default temp dir
+TMPFS_ROOT = '/dev/shm'
+
+# Directory created by pytest_configure, the only one pytest_unconfigure may remove
+_session_tmpdir = None
+
+
+def pytest_configure(config):
+    """Point tempfile at a private directory on tmpfs, where available."""
+    global _session_tmpdir
+    if os.getenv('AUTODELETE_TESTS_NO_TMPFS') or not os.path.isdir(TMPFS_ROOT):
+        return
+    # One directory per process, so pytest-xdist workers never remove each other's files
+    _session_tmpdir = tempfile.mkdtemp(prefix='autodelete-tests-', dir=TMPFS_ROOT)
+    tempfile.tempdir = _session_tmpdir
+
+
+def pytest_unconfigure(config):
+    """Remove the tmpfs directory created for the session."""
+    global _session_tmpdir
+    if _session_tmpdir is None:
+        return
+    shutil.rmtree(_session_tmpdir, ignore_errors=True)
+    if tempfile.tempdir == _session_tmpdir:
+        tempfile.tempdir = None
+    _session_tmpdir = None
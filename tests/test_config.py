@@ -1,160 +1,127 @@
 """Unit tests for configuration validation."""
 
 import os
-import sys
+import tempfile
 import unittest
 import config
-import tempfile
-from unittest.mock import patch, mock_open
-
-# Add parent directory to path for imports
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
+from unittest.mock import patch
 
 
 class TestConfig(unittest.TestCase):
     """Test cases for configuration."""
 
-    def setUp(self):
-        """Set up test environment."""
-        # Backup original environment variables
-        self.original_env = os.environ.copy()
-
-    def tearDown(self):
-        """Clean up test environment."""
-        # Restore original environment variables
-        os.environ.clear()
-        os.environ.update(self.original_env)
-
     def test_bot_token_required(self):
         """Test that bot token is required."""
-        # Clear environment
-        if 'BOT_TOKEN' in os.environ:
-            del os.environ['BOT_TOKEN']
-
-        # Reload config
-        import importlib
-        importlib.reload(config)
+        cfg = config.load_config({})
 
         # Bot token should be None
-        self.assertIsNone(config.BOT_TOKEN)
+        self.assertIsNone(cfg.BOT_TOKEN)
 
     def test_channel_id_required(self):
         """Test that channel ID is required."""
-        # Clear environment
-        if 'CHANNEL_ID' in os.environ:
-            del os.environ['CHANNEL_ID']
-
-        # Reload config
-        import importlib
-        importlib.reload(config)
+        cfg = config.load_config({})
 
         # Channel ID should be None
-        self.assertIsNone(config.CHANNEL_ID)
+        self.assertIsNone(cfg.CHANNEL_ID)
+        self.assertIsNone(cfg.CHANNEL_ID_INT)
 
     def test_user_id_configuration(self):
         """Test user ID configuration."""
-        # Set user ID
-        os.environ['USER_ID'] = '12345'
-
-        # Reload config
-        import importlib
-        importlib.reload(config)
+        cfg = config.load_config({'USER_ID': '12345'})
 
         # User ID should be set
-        self.assertEqual(config.USER_ID, '12345')
+        self.assertEqual(cfg.USER_ID, '12345')
 
     def test_username_configuration(self):
         """Test username configuration."""
-        # Set username
-        os.environ['USER_USERNAME'] = 'testuser'
-
-        # Reload config
-        import importlib
-        importlib.reload(config)
+        cfg = config.load_config({'USER_USERNAME': 'testuser'})
 
         # Username should be set
-        self.assertEqual(config.USER_USERNAME, 'testuser')
+        self.assertEqual(cfg.USER_USERNAME, 'testuser')
 
     def test_default_values(self):
         """Test default configuration values."""
-        # Clear environment
-        os.environ.clear()
-
-        # Reload config
-        import importlib
-        importlib.reload(config)
+        cfg = config.load_config({})
 
         # Check default values
-        self.assertEqual(config.DELETE_AFTER_MINUTES, 86400)
-        self.assertEqual(config.CHECK_INTERVAL_MINUTES, 720)
-        self.assertEqual(config.LOG_LEVEL, 'INFO')
-        self.assertEqual(config.DATABASE_PATH, 'messages.db')
-        self.assertEqual(config.LOG_FILE, 'bot.log')
+        self.assertEqual(cfg.DELETE_AFTER_MINUTES, 86400)
+        self.assertEqual(cfg.CHECK_INTERVAL_MINUTES, 720)
+        self.assertEqual(cfg.LOG_LEVEL, 'INFO')
+        self.assertEqual(cfg.DATABASE_PATH, 'messages.db')
+        self.assertEqual(cfg.LOG_FILE, 'bot.log')
+        self.assertEqual(cfg.LOG_MAX_BYTES, 10485760)
+        self.assertEqual(cfg.LOG_BACKUP_COUNT, 5)
 
     def test_custom_delete_minutes(self):
         """Test custom delete minutes configuration."""
-        # Set custom delete minutes
-        os.environ['DELETE_AFTER_MINUTES'] = '129600'  # 90 days in minutes
-
-        # Reload config
-        import importlib
-        importlib.reload(config)
+        cfg = config.load_config({'DELETE_AFTER_MINUTES': '129600'})  # 90 days in minutes
 
         # Custom value should be used
-        self.assertEqual(config.DELETE_AFTER_MINUTES, 129600)
+        self.assertEqual(cfg.DELETE_AFTER_MINUTES, 129600)
 
     def test_custom_check_interval(self):
         """Test custom check interval configuration."""
-        # Set custom check interval
-        os.environ['CHECK_INTERVAL_MINUTES'] = '1440'  # 24 hours = 1440 minutes
-
-        # Reload config
-        import importlib
-        importlib.reload(config)
+        cfg = config.load_config({'CHECK_INTERVAL_MINUTES': '1440'})  # 24 hours = 1440 minutes
 
         # Custom value should be used
-        self.assertEqual(config.CHECK_INTERVAL_MINUTES, 1440)
+        self.assertEqual(cfg.CHECK_INTERVAL_MINUTES, 1440)
 
     def test_custom_log_level(self):
         """Test custom log level configuration."""
-        # Set custom log level
-        os.environ['LOG_LEVEL'] = 'DEBUG'
-
-        # Reload config
-        import importlib
-        importlib.reload(config)
+        cfg = config.load_config({'LOG_LEVEL': 'DEBUG'})
 
         # Custom value should be used
-        self.assertEqual(config.LOG_LEVEL, 'DEBUG')
+        self.assertEqual(cfg.LOG_LEVEL, 'DEBUG')
 
     def test_environment_variable_priority(self):
         """Test that environment variables take priority over defaults."""
-        # Set environment variables
-        os.environ['BOT_TOKEN'] = 'test_token'
-        os.environ['CHANNEL_ID'] = 'test_channel'
-        os.environ['USER_ID'] = 'test_user'
-
-        # Reload config
-        import importlib
-        importlib.reload(config)
+        cfg = config.load_config({
+            'BOT_TOKEN': 'test_token',
+            'CHANNEL_ID': 'test_channel',
+            'USER_ID': 'test_user',
+        })
 
         # Environment values should be used
-        self.assertEqual(config.BOT_TOKEN, 'test_token')
-        self.assertEqual(config.CHANNEL_ID, 'test_channel')
-        self.assertEqual(config.USER_ID, 'test_user')
+        self.assertEqual(cfg.BOT_TOKEN, 'test_token')
+        self.assertEqual(cfg.CHANNEL_ID, 'test_channel')
+        self.assertEqual(cfg.CHANNEL_ID_INT, 'test_channel')
+        self.assertEqual(cfg.USER_ID, 'test_user')
+
+    def test_channel_id_parsed_as_int(self):
+        """Test numeric channel IDs are parsed to int once."""
+        cfg = config.load_config({'CHANNEL_ID': '-1001234567890'})
+
+        self.assertEqual(cfg.CHANNEL_ID, '-1001234567890')
+        self.assertEqual(cfg.CHANNEL_ID_INT, -1001234567890)
+
+    @patch.dict(os.environ, {'BOT_TOKEN': 'env_token', 'LOG_LEVEL': 'WARNING'}, clear=True)
+    def test_load_config_reads_process_environment(self):
+        """Test load_config() defaults to the process environment."""
+        cfg = config.load_config()
+
+        self.assertEqual(cfg.BOT_TOKEN, 'env_token')
+        self.assertEqual(cfg.LOG_LEVEL, 'WARNING')
+        self.assertIsNone(cfg.CHANNEL_ID)
+
+    def test_module_values_match_environment(self):
+        """Test module-level settings are loaded from the process environment."""
+        cfg = config.load_config()
+
+        self.assertEqual(config.BOT_TOKEN, cfg.BOT_TOKEN)
+        self.assertEqual(config.CHANNEL_ID_INT, cfg.CHANNEL_ID_INT)
+        self.assertEqual(config.DELETE_AFTER_MINUTES, cfg.DELETE_AFTER_MINUTES)
 
     def test_missing_dotenv_file(self):
         """Test behavior when .env file is missing."""
-        # Clear environment
-        os.environ.clear()
-
-        # Reload config (should not fail)
-        try:
-            import importlib
-            importlib.reload(config)
-        except Exception as e:
-            self.fail(f"Config loading failed: {e}")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # A missing .env file is skipped rather than raising
+            self.assertFalse(config.load_dotenv(os.path.join(tmp_dir, '.env')))
+
+        # Without any variables the defaults apply
+        cfg = config.load_config({})
+        self.assertIsNone(cfg.BOT_TOKEN)
+        self.assertEqual(cfg.DELETE_AFTER_MINUTES, 86400)
+        self.assertEqual(cfg.LOG_FILE, 'bot.log')
 
 
 if __name__ == '__main__':
@@ -3,14 +3,11 @@
 import unittest
 import tempfile
 import os
+import sqlite3
 from datetime import datetime, timedelta
 from unittest.mock import patch, MagicMock
 
-# Add parent directory to path for imports
-import sys
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
-from database import MessageDatabase
+from database import MessageDatabase, _SELECT_EXPIRED_PAGE_SQL
 
 
 class TestMessageDatabase(unittest.TestCase):
@@ -18,28 +15,12 @@ class TestMessageDatabase(unittest.TestCase):
 
     def setUp(self):
         """Set up test database."""
-        # Create temporary database file
-        self.temp_db = tempfile.NamedTemporaryFile(delete=False, suffix='.db')
-        self.temp_db.close()
-        self.db = MessageDatabase(self.temp_db.name)
+        # In-memory database, nothing touches the disk
+        self.db = MessageDatabase(':memory:')
 
     def tearDown(self):
         """Clean up test database."""
-        # Remove temporary database file
-        os.unlink(self.temp_db.name)
-
-    def test_init_database(self):
-        """Test database initialization."""
-        # Check if database file was created
-        self.assertTrue(os.path.exists(self.temp_db.name))
-
-        # Check if messages table exists by trying to add a message
-        message_id = 123
-        chat_id = 456
-        forward_date = datetime.now()
-
-        result = self.db.add_message(message_id, chat_id, forward_date)
-        self.assertTrue(result)
+        self.db.close()
 
     def test_add_message(self):
         """Test adding a message to database."""
@@ -55,6 +36,26 @@ class TestMessageDatabase(unittest.TestCase):
         messages = self.db.get_messages_to_delete()
         self.assertEqual(len(messages), 0)
 
+    def test_add_message_returns_record(self):
+        """Test adding messages returns increasing record ids and the stored delete date."""
+        forward_date = datetime.now() - timedelta(days=61)
+        first_id, delete_date = self.db.add_message(123, 456, forward_date)
+        second_id, _ = self.db.add_message(124, 456, datetime.now())
+        self.assertEqual(second_id, first_id + 1)
+        self.assertEqual(delete_date, int(forward_date.timestamp()) + 86400 * 60)
+
+        messages = self.db.get_messages_to_delete()
+        self.assertEqual(messages[0][2], first_id)
+
+    def test_record_ids_not_reused(self):
+        """Test ids of deleted records are not handed out again."""
+        first_id, _ = self.db.add_message(111, 456, datetime.now())
+        second_id, _ = self.db.add_message(222, 456, datetime.now())
+        self.db.delete_message_records([first_id, second_id])
+
+        third_id, _ = self.db.add_message(333, 456, datetime.now())
+        self.assertEqual(third_id, second_id + 1)
+
     def test_add_message_with_future_date(self):
         """Test adding a message with future date."""
         message_id = 123
@@ -80,56 +81,144 @@ class TestMessageDatabase(unittest.TestCase):
         self.assertEqual(messages[0][0], message_id)  # message_id
         self.assertEqual(messages[0][1], chat_id)    # chat_id
 
-    def test_delete_message_record(self):
-        """Test deleting a message record."""
-        # Add a message first
-        message_id = 123
-        chat_id = 456
+    def test_timestamps_stored_as_integers(self):
+        """Test new rows store unix-second integers rather than ISO-8601 text."""
         forward_date = datetime.now()
+        self.db.add_message(123, 456, forward_date)
+
+        row = self.db._connection().execute(
+            'SELECT typeof(forward_date), typeof(delete_date), typeof(created_at), forward_date FROM messages'
+        ).fetchone()
+        self.assertEqual(row[:3], ('integer', 'integer', 'integer'))
+        self.assertEqual(row[3], int(forward_date.timestamp()))
+
+    def test_iter_messages_to_delete(self):
+        """Test expired messages are paged in delete order without repeating or skipping rows."""
+        for message_id in range(5):
+            self.db.add_message(message_id, 456, datetime.now() - timedelta(days=61, minutes=message_id))
+        self.db.add_message(99, 456, datetime.now())
+
+        pages = self.db.iter_messages_to_delete(batch=2)
+        first = next(pages)
+        self.assertEqual([row[0] for row in first], [4, 3])
+
+        # Deleting rows between pages does not shift the next page
+        self.db.delete_message_records([row[2] for row in first])
+        self.assertEqual([[row[0] for row in page] for page in pages], [[2, 1], [0]])
+
+    def test_expired_page_uses_index(self):
+        """Test each page is a range seek on the clustered primary key, bounded by the expiry time."""
+        now = int(datetime.now().timestamp())
+        plan = self.db._connection().execute(
+            'EXPLAIN QUERY PLAN ' + _SELECT_EXPIRED_PAGE_SQL, (0, 0, now, 100)
+        ).fetchall()
+
+        details = ' '.join(row[3] for row in plan)
+        self.assertIn('SEARCH messages USING PRIMARY KEY ((delete_date,id)>(?,?) AND delete_date<?)', details)
+        self.assertNotIn('USE TEMP B-TREE', details)
+
+    def test_get_status_counts(self):
+        """Test total and pending counts are returned together."""
+        self.assertEqual(self.db.get_status_counts(), (0, 0))
+
+        self.db.add_message(111, 456, datetime.now() - timedelta(days=61))
+        self.db.add_message(222, 456, datetime.now())
+
+        self.assertEqual(self.db.get_status_counts(), (2, 1))
+
+    def test_init_database_analyzes(self):
+        """Test planner statistics are gathered when the database is opened."""
+        stat_table = self.db._connection().execute(
+            "SELECT name FROM sqlite_master WHERE name = 'sqlite_stat1'"
+        ).fetchone()
+        self.assertIsNotNone(stat_table)
 
-        self.db.add_message(message_id, chat_id, forward_date)
+    def test_delete_message_record(self):
+        """Test deleting a message record."""
+        # Add an expired message
+        self.db.add_message(123, 456, datetime.now() - timedelta(days=61))
 
         # Get the record ID from get_messages_to_delete
         messages = self.db.get_messages_to_delete()
-        if messages:
-            record_id = messages[0][2]  # record ID is the third element
+        self.assertEqual(len(messages), 1)
+        record_id = messages[0][2]  # record ID is the third element
+
+        # Delete the record
+        self.assertTrue(self.db.delete_message_record(record_id))
+
+        # Verify it's gone
+        self.assertEqual(self.db.get_messages_to_delete(), [])
 
-            # Delete the record
-            result = self.db.delete_message_record(record_id)
-            self.assertTrue(result)
+        # A record that is already gone is not reported as removed
+        self.assertFalse(self.db.delete_message_record(record_id))
 
-            # Verify it's gone
-            messages_after = self.db.get_messages_to_delete()
-            self.assertEqual(len(messages_after), 0)
+    def test_delete_message_record_by_key(self):
+        """Test deleting by the full key only matches the record with that delete date."""
+        record_id, delete_date = self.db.add_message(123, 456, datetime.now())
+
+        self.assertFalse(self.db.delete_message_record(record_id, delete_date - 1))
+        self.assertEqual(self.db.get_status_counts(), (1, 0))
+
+        self.assertTrue(self.db.delete_message_record(record_id, delete_date))
+        self.assertEqual(self.db.get_status_counts(), (0, 0))
+
+        # Deleting the same key again finds nothing
+        self.assertFalse(self.db.delete_message_record(record_id, delete_date))
 
     def test_cleanup_old_records(self):
         """Test cleaning up old records."""
-        # Add a message
-        message_id = 123
-        chat_id = 456
-        forward_date = datetime.now()
+        # Add a message that expired a day ago
+        self.db.add_message(123, 456, datetime.now() - timedelta(days=61))
 
-        self.db.add_message(message_id, chat_id, forward_date)
+        # Clean up records expired more than 7 days ago
+        deleted_count = self.db.cleanup_old_records()
+        self.assertEqual(deleted_count, 0)  # Record has not been expired long enough
 
-        # Clean up records older than 1 day (should remove our recent record)
-        deleted_count = self.db.cleanup_old_records(days=1)
-        self.assertEqual(deleted_count, 0)  # Record is not old enough
-
-        # Clean up records older than 0 days (should remove our record)
+        # Clean up records expired more than 0 days ago (should remove our record)
         deleted_count = self.db.cleanup_old_records(days=0)
         self.assertEqual(deleted_count, 1)  # Record should be removed
 
+    def test_cleanup_old_records_keeps_pending(self):
+        """Test a record added long ago but not yet expired survives the cleanup."""
+        self.db.add_message(123, 456, datetime.now() - timedelta(days=30))
+        self.db._connection().execute('UPDATE messages SET created_at = unixepoch() - 30 * 86400')
+
+        self.assertEqual(self.db.cleanup_old_records(), 0)
+        self.assertEqual(self.db.get_status_counts(), (1, 0))
+
+    def test_delete_message_records(self):
+        """Test deleting several message records at once."""
+        self.db.add_message(111, 456, datetime.now() - timedelta(days=61))
+        self.db.add_message(222, 456, datetime.now() - timedelta(days=62))
+        self.db.add_message(333, 456, datetime.now() - timedelta(days=63))
+
+        messages = self.db.get_messages_to_delete()
+        record_ids = [msg[2] for msg in messages if msg[0] != 222]
+
+        result = self.db.delete_message_records(record_ids)
+        self.assertTrue(result)
+
+        remaining = self.db.get_messages_to_delete()
+        self.assertEqual([msg[0] for msg in remaining], [222])
+
+    def test_vacuum_if_due(self):
+        """Test vacuum runs once and is skipped until the interval passes."""
+        self.assertTrue(self.db.optimize())
+        self.assertTrue(self.db.vacuum_if_due())
+        self.assertFalse(self.db.vacuum_if_due())
+        self.assertTrue(self.db.vacuum_if_due(interval_days=0))
+
     def test_add_message_invalid_data(self):
         """Test adding message with invalid data."""
         # Test with None values
         result = self.db.add_message(None, 456, datetime.now())
-        self.assertFalse(result)
+        self.assertIsNone(result)
 
         result = self.db.add_message(123, None, datetime.now())
-        self.assertFalse(result)
+        self.assertIsNone(result)
 
         result = self.db.add_message(123, 456, None)
-        self.assertFalse(result)
+        self.assertIsNone(result)
 
     def test_database_connection_error(self):
         """Test database connection error handling."""
@@ -141,5 +230,96 @@ class TestMessageDatabase(unittest.TestCase):
         self.assertFalse(result)
 
 
+class TestMessageDatabaseFile(unittest.TestCase):
+    """Test cases that need a database file on disk."""
+
+    def setUp(self):
+        """Set up test database."""
+        # Create temporary database file
+        self.temp_db = tempfile.NamedTemporaryFile(delete=False, suffix='.db')
+        self.temp_db.close()
+        self.db = MessageDatabase(self.temp_db.name)
+
+    def tearDown(self):
+        """Clean up test database."""
+        # Remove temporary database file
+        self.db.close()
+        os.unlink(self.temp_db.name)
+
+    def test_init_database(self):
+        """Test database initialization."""
+        # Check if database file was created
+        self.assertTrue(os.path.exists(self.temp_db.name))
+
+        # Check if messages table exists by trying to add a message
+        message_id = 123
+        chat_id = 456
+        forward_date = datetime.now()
+
+        result = self.db.add_message(message_id, chat_id, forward_date)
+        self.assertTrue(result)
+
+    def test_connection_pragmas(self):
+        """Test connections are opened in WAL mode with relaxed syncing."""
+        with self.db._connect() as conn:
+            self.assertEqual(conn.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+            self.assertEqual(conn.execute('PRAGMA synchronous').fetchone()[0], 1)  # NORMAL
+            self.assertEqual(conn.execute('PRAGMA temp_store').fetchone()[0], 2)  # MEMORY
+
+    def test_migrate_text_timestamps(self):
+        """Test timestamps written as text by older versions are converted."""
+        self.db.close()
+        os.unlink(self.temp_db.name)
+
+        # Create a database the way older versions did
+        conn = sqlite3.connect(self.temp_db.name)
+        conn.execute('''
+            CREATE TABLE messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                message_id INTEGER NOT NULL,
+                chat_id INTEGER NOT NULL,
+                forward_date TIMESTAMP NOT NULL,
+                delete_date TIMESTAMP NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        past_date = datetime.now() - timedelta(days=61)
+        conn.execute(
+            'INSERT INTO messages (message_id, chat_id, forward_date, delete_date) VALUES (?, ?, ?, ?)',
+            (123, 456, str(past_date), str(past_date + timedelta(days=60)))
+        )
+        conn.commit()
+        conn.close()
+
+        self.db = MessageDatabase(self.temp_db.name)
+
+        messages = self.db.get_messages_to_delete()
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0][0], 123)
+
+        row = self.db._connection().execute(
+            'SELECT typeof(forward_date), typeof(delete_date), typeof(created_at), delete_date FROM messages'
+        ).fetchone()
+        self.assertEqual(row[:3], ('integer', 'integer', 'integer'))
+        self.assertEqual(row[3], int((past_date + timedelta(days=60)).timestamp()))
+
+        # Table is rebuilt clustered on (delete_date, id)
+        table_sql = self.db._connection().execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'messages'"
+        ).fetchone()[0]
+        self.assertIn('WITHOUT ROWID', table_sql)
+
+    def test_connection_is_reused(self):
+        """Test the connection is opened once and reopened after close."""
+        conn = self.db._connection()
+        self.assertIs(self.db._connection(), conn)
+
+        self.db.close()
+        self.assertIsNone(self.db._conn)
+
+        # Database remains usable after close
+        self.assertTrue(self.db.add_message(123, 456, datetime.now()))
+
+
 if __name__ == '__main__':
     unittest.main()
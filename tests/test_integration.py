@@ -1,35 +1,34 @@
 """Integration tests for the Auto-Delete Telegram Bot."""
 
 import unittest
-import tempfile
-import os
-import asyncio
 from datetime import datetime, timedelta
 from unittest.mock import patch, MagicMock, AsyncMock
 
-# Add parent directory to path for imports
-import sys
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from telegram import Bot
 
 from database import MessageDatabase
-from utils import delete_message_notify
+from utils import setup_logging, _reset_logging_for_tests, delete_message_notify, purge_expired_messages
 import config
 
 
-class TestIntegration(unittest.TestCase):
+class TestIntegration(unittest.IsolatedAsyncioTestCase):
     """Integration test cases."""
 
+    @classmethod
+    def setUpClass(cls):
+        """Create the bot mock shared by all tests."""
+        # Specced so misspelled Bot methods fail; reset after each test
+        cls.mock_bot = AsyncMock(spec=Bot)
+
     def setUp(self):
         """Set up test environment."""
-        # Create temporary database file
-        self.temp_db = tempfile.NamedTemporaryFile(delete=False, suffix='.db')
-        self.temp_db.close()
-        self.db = MessageDatabase(self.temp_db.name)
+        # In-memory database, nothing touches the disk
+        self.db = MessageDatabase(':memory:')
 
     def tearDown(self):
         """Clean up test environment."""
-        # Remove temporary database file
-        os.unlink(self.temp_db.name)
+        self.db.close()
+        self.mock_bot.reset_mock(return_value=True, side_effect=True)
 
     def test_message_lifecycle(self):
         """Test complete message lifecycle from creation to deletion."""
@@ -56,33 +55,31 @@ class TestIntegration(unittest.TestCase):
         messages_after = self.db.get_messages_to_delete()
         self.assertEqual(len(messages_after), 0)
 
-    def test_bot_database_integration(self):
+    async def test_bot_database_integration(self):
         """Test integration between bot operations and database."""
-        # Mock bot
-        mock_bot = AsyncMock()
-
         # Add message to database
         message_id = 789
         chat_id = 101
         forward_date = datetime.now() - timedelta(days=61)  # Older than 60 days
 
-        self.db.add_message(message_id, chat_id, forward_date)
+        record_id, delete_date = self.db.add_message(message_id, chat_id, forward_date)
 
         # Get message for deletion
         messages = self.db.get_messages_to_delete()
         self.assertEqual(len(messages), 1)
-        record_id = messages[0][2]
+        self.assertEqual(messages[0][2], record_id)
 
-        # Test integrated deletion using asyncio.run
-        import asyncio
-        success, error_msg = asyncio.run(delete_message_notify(mock_bot, self.db, message_id, chat_id, record_id))
+        # Test integrated deletion, matching the record on its full key as the scheduled job does
+        success, error_msg = await delete_message_notify(
+            self.mock_bot, self.db, '12345', (message_id, chat_id, record_id, delete_date)
+        )
 
         # Verify success
         self.assertTrue(success)
         self.assertIsNone(error_msg)
 
         # Verify bot.delete_message was called
-        mock_bot.delete_message.assert_called_once_with(chat_id=chat_id, message_id=message_id)
+        self.mock_bot.delete_message.assert_called_once_with(chat_id=chat_id, message_id=message_id)
 
         # Verify message record was removed from database
         messages_after = self.db.get_messages_to_delete()
@@ -110,23 +107,50 @@ class TestIntegration(unittest.TestCase):
         self.assertIn(555, expired_ids)
         self.assertNotIn(333, expired_ids)
 
+    async def test_purge_expired_messages(self):
+        """Test purging keeps records whose Telegram deletion failed."""
+        async def delete_messages(chat_id, message_ids):
+            if chat_id == 444:
+                raise Exception("Bot error")
+
+        self.mock_bot.delete_messages.side_effect = delete_messages
+
+        self.db.add_message(111, 222, datetime.now() - timedelta(days=61))
+        self.db.add_message(333, 444, datetime.now() - timedelta(days=62))
+
+        deleted_count, failed_count = await purge_expired_messages(self.mock_bot, self.db, '12345')
+        self.assertEqual(deleted_count, 1)
+        self.assertEqual(failed_count, 1)
+
+        # The failed message is kept for retry
+        messages = self.db.get_messages_to_delete()
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0][0], 333)
+
     def test_database_persistence(self):
         """Test that database persists data between instances."""
+        # Shared-cache in-memory database lives as long as one connection to it is open
+        db_uri = 'file:test_database_persistence?mode=memory&cache=shared'
+        db = MessageDatabase(db_uri)
+
         # Add message
         message_id = 999
         chat_id = 888
         forward_date = datetime.now() - timedelta(days=61)  # Older than 60 days
 
-        self.db.add_message(message_id, chat_id, forward_date)
+        db.add_message(message_id, chat_id, forward_date)
 
         # Create new database instance (simulating restart)
-        new_db = MessageDatabase(self.temp_db.name)
+        new_db = MessageDatabase(db_uri)
 
         # Verify message still exists
         messages = new_db.get_messages_to_delete()
         self.assertEqual(len(messages), 1)
         self.assertEqual(messages[0][0], message_id)
 
+        new_db.close()
+        db.close()
+
     def test_error_handling_integration(self):
         """Test error handling across components."""
         # Test with invalid database path
@@ -143,9 +167,9 @@ class TestIntegration(unittest.TestCase):
     def test_configuration_integration(self):
         """Test configuration integration with components."""
         # Mock configuration
-        with patch('config.DATABASE_PATH', self.temp_db.name):
+        with patch('config.DATABASE_PATH', ':memory:'):
             # Create database with mocked config
-            test_db = MessageDatabase(self.temp_db.name)
+            test_db = MessageDatabase(config.DATABASE_PATH)
 
             # Test that it works
             result = test_db.add_message(123, 456, datetime.now())
@@ -153,8 +177,13 @@ class TestIntegration(unittest.TestCase):
 
     def test_logging_integration(self):
         """Test logging integration across components."""
+        # Start from an unconfigured logger; afterwards close the handlers installed here
+        # and leave logging configured for the following tests
+        _reset_logging_for_tests()
+        self.addCleanup(setup_logging)
+        self.addCleanup(_reset_logging_for_tests)
+
         # Test that setup_logging returns a logger
-        from utils import setup_logging
         logger = setup_logging()
 
         # Verify logger is properly configured
@@ -0,0 +1,179 @@
+"""Unit tests for the AutoDeleteBot handlers."""
+
+import asyncio
+import unittest
+from datetime import datetime
+from unittest.mock import patch, call, MagicMock, AsyncMock
+
+from telegram import Chat, MessageOriginChannel, MessageOriginUser, User
+
+from database import MessageDatabase
+from telegram_bot import AutoDeleteBot, STATUS_CACHE_SECONDS
+
+CHANNEL_ID = -1001234567890
+
+
+class TestAutoDeleteBot(unittest.IsolatedAsyncioTestCase):
+    """Test cases for AutoDeleteBot."""
+
+    def setUp(self):
+        """Create a bot backed by a specced database mock."""
+        with patch('telegram_bot.MessageDatabase', return_value=MagicMock(spec=MessageDatabase)):
+            self.bot = AutoDeleteBot()
+        self.bot._channel_id = CHANNEL_ID
+        self.bot._notify_target = '12345'
+
+        self.update = MagicMock()
+        self.update.message.forward_origin = MessageOriginChannel(
+            date=datetime(2024, 3, 5, 7, 8, 9), chat=Chat(CHANNEL_ID, Chat.CHANNEL), message_id=42
+        )
+        self.update.message.reply_text = AsyncMock()
+        self.context = MagicMock()
+        self.context.job_queue.get_jobs_by_name.return_value = ()
+
+    @patch('telegram_bot.time.time', return_value=1_700_000_000)
+    async def test_forwarded_message_schedules_deletion(self, _mock_time):
+        """Test a forwarded message gets a sweep job at its delete date."""
+        self.bot.db.add_message.return_value = (7, 1_700_003_600)
+
+        await self.bot.handle_forwarded_message(self.update, self.context)
+
+        self.bot.db.add_message.assert_called_once_with(42, CHANNEL_ID, datetime(2024, 3, 5, 7, 8, 9))
+        self.context.job_queue.run_once.assert_called_once_with(
+            self.bot.delete_due_job, when=3600, name='sweep-1700003600'
+        )
+
+    @patch('telegram_bot.time.time', return_value=1_700_000_000)
+    async def test_forwarded_messages_due_together_share_a_job(self, _mock_time):
+        """Test no second job is scheduled for a message expiring in the same second as another."""
+        self.bot.db.add_message.return_value = (8, 1_700_003_600)
+        self.context.job_queue.get_jobs_by_name.return_value = (MagicMock(),)
+
+        await self.bot.handle_forwarded_message(self.update, self.context)
+
+        self.context.job_queue.get_jobs_by_name.assert_called_once_with('sweep-1700003600')
+        self.context.job_queue.run_once.assert_not_called()
+
+    @patch('telegram_bot.time.time', return_value=1_700_000_000)
+    async def test_forwarded_message_already_expired(self, _mock_time):
+        """Test a message past its delete date is scheduled for immediate deletion."""
+        self.bot.db.add_message.return_value = (7, 1_699_990_000)
+
+        await self.bot.handle_forwarded_message(self.update, self.context)
+
+        self.assertEqual(self.context.job_queue.run_once.call_args[1]['when'], 0)
+
+    async def test_forwarded_message_from_other_channel(self):
+        """Test forwards from another channel are ignored."""
+        self.update.message.forward_origin = MessageOriginChannel(
+            date=datetime(2024, 3, 5, 7, 8, 9), chat=Chat(-1009876543210, Chat.CHANNEL), message_id=42
+        )
+
+        await self.bot.handle_forwarded_message(self.update, self.context)
+
+        self.bot.db.add_message.assert_not_called()
+
+    async def test_forwarded_message_from_user(self):
+        """Test forwards of user messages are ignored, having no channel message to delete."""
+        self.update.message.forward_origin = MessageOriginUser(
+            date=datetime(2024, 3, 5, 7, 8, 9), sender_user=User(1, 'Someone', False)
+        )
+
+        await self.bot.handle_forwarded_message(self.update, self.context)
+
+        self.bot.db.add_message.assert_not_called()
+
+    async def test_forwarded_message_not_stored(self):
+        """Test no job is scheduled when the record could not be stored."""
+        self.bot.db.add_message.return_value = None
+
+        await self.bot.handle_forwarded_message(self.update, self.context)
+
+        self.context.job_queue.run_once.assert_not_called()
+        self.update.message.reply_text.assert_called_once_with("❌ Failed to schedule message for deletion.")
+
+    async def test_delete_due_job_sweeps(self):
+        """Test a due job runs the guarded sweep rather than deleting a single message."""
+        self.context.application.create_task.side_effect = asyncio.create_task
+
+        with patch.object(self.bot, 'delete_expired_messages', new_callable=AsyncMock) as mock_sweep:
+            await self.bot.delete_due_job(self.context)
+
+        mock_sweep.assert_awaited_once()
+
+    async def test_delete_due_job_during_sweep_sweeps_again(self):
+        """Test messages falling due during a sweep get one more sweep, however many jobs fire."""
+        self.context.application.create_task.side_effect = asyncio.create_task
+
+        with patch.object(self.bot, 'delete_expired_messages', new_callable=AsyncMock) as mock_sweep:
+            self.bot.start_sweep(self.context.application)
+            await self.bot.delete_due_job(self.context)
+            await self.bot.delete_due_job(self.context)
+            await self.bot._sweep_task
+
+        self.assertEqual(mock_sweep.await_count, 2)
+
+    async def test_cleanup_command_runs_one_sweep_at_a_time(self):
+        """Test /cleanup during a running sweep replies instead of starting a second one."""
+        self.context.application.create_task.side_effect = asyncio.create_task
+
+        with patch.object(self.bot, 'delete_expired_messages', new_callable=AsyncMock) as mock_sweep:
+            await self.bot.cleanup_command(self.update, self.context)
+            await self.bot.cleanup_command(self.update, self.context)
+            await self.bot._sweep_task
+
+            # Once the sweep has finished, /cleanup starts a new one
+            await self.bot.cleanup_command(self.update, self.context)
+            await self.bot._sweep_task
+
+        self.assertEqual(mock_sweep.await_count, 2)
+        self.assertEqual(self.update.message.reply_text.call_args_list, [
+            call("🧹 Cleanup queued! Expired messages will be deleted shortly."),
+            call("🧹 Cleanup already running. Expired messages are being deleted."),
+            call("🧹 Cleanup queued! Expired messages will be deleted shortly."),
+        ])
+
+    async def test_periodic_sweep_skipped_while_running(self):
+        """Test the periodic job does not start a sweep next to a running one."""
+        self.context.application.create_task.side_effect = asyncio.create_task
+
+        with patch.object(self.bot, 'delete_expired_messages', new_callable=AsyncMock) as mock_sweep:
+            self.bot.start_sweep(self.context.application)
+            await self.bot.delete_expired_job(self.context)
+            await self.bot._sweep_task
+
+        mock_sweep.assert_awaited_once()
+
+    @patch('telegram_bot.time.monotonic', return_value=1000.0)
+    async def test_status_counts_cached(self, _mock_monotonic):
+        """Test counts are served from the cache within STATUS_CACHE_SECONDS."""
+        self.bot.db.get_status_counts.return_value = (5, 2)
+
+        self.assertEqual(await self.bot.get_status_counts(), (5, 2))
+        self.assertEqual(await self.bot.get_status_counts(), (5, 2))
+
+        self.bot.db.get_status_counts.assert_called_once()
+
+    @patch('telegram_bot.time.monotonic')
+    async def test_status_counts_expire(self, mock_monotonic):
+        """Test the database is queried again once the cached counts are too old."""
+        self.bot.db.get_status_counts.side_effect = [(5, 2), (6, 3)]
+
+        mock_monotonic.return_value = 1000.0
+        self.assertEqual(await self.bot.get_status_counts(), (5, 2))
+        mock_monotonic.return_value = 1000.0 + STATUS_CACHE_SECONDS
+        self.assertEqual(await self.bot.get_status_counts(), (6, 3))
+
+        self.assertEqual(self.bot.db.get_status_counts.call_count, 2)
+
+    @patch('telegram_bot.time.monotonic', return_value=1000.0)
+    async def test_status_counts_failure_not_cached(self, _mock_monotonic):
+        """Test a failed query is not cached, so the next call retries it."""
+        self.bot.db.get_status_counts.side_effect = [None, (5, 2)]
+
+        self.assertIsNone(await self.bot.get_status_counts())
+        self.assertEqual(await self.bot.get_status_counts(), (5, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,169 +1,349 @@
 """Unit tests for utility functions."""
 
 import unittest
-import tempfile
+import logging
 import os
-from unittest.mock import patch, MagicMock, AsyncMock
-
-# Add parent directory to path for imports
-import sys
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import time
+from logging.handlers import QueueHandler
+from unittest.mock import patch, call, MagicMock, AsyncMock
+
+from telegram import Bot
+from telegram.error import BadRequest, NetworkError
+
+from database import MessageDatabase
+from utils import (
+    setup_logging, _reset_logging_for_tests, _timestamp, get_notify_user, format_deletion_notification,
+    send_deletion_notification, delete_message_notify, purge_expired_messages, format_summary,
+    wait_for_notifications
+)
+
+# Complete notification texts for a fixed timestamp, compared as whole strings
+SUCCESS_SNAPSHOT = (
+    "<b>✅ Message Deleted Successfully</b>\n\n"
+    "<b>Message ID:</b> 123\n"
+    "<b>Channel ID:</b> 456\n"
+    "<b>Deleted at:</b> 2024-03-05 07:08:09"
+)
+FAILURE_SNAPSHOT = (
+    "<b>❌ Message Deletion Failed</b>\n\n"
+    "<b>Message ID:</b> 123\n"
+    "<b>Channel ID:</b> 456\n"
+    "<b>Error:</b> Message &lt;123&gt; not found\n"
+    "<b>Time:</b> 2024-03-05 07:08:09"
+)
+SUMMARY_SNAPSHOT = (
+    "<b>🧹 Cleanup Summary</b>\n\n"
+    "<b>✅ Deleted:</b> 2 messages\n"
+    "<b>❌ Failed:</b> 1 messages\n"
+    "• 3 in 10: Bot error\n"
+    "<b>Time:</b> 2024-03-05 07:08:09"
+)
+
+
+class TestUtils(unittest.IsolatedAsyncioTestCase):
+    """Test cases for utility functions."""
 
-from utils import setup_logging, send_deletion_notification, delete_message_notify
+    @classmethod
+    def setUpClass(cls):
+        """Set up test environment shared by all tests."""
+        # Mock config once for the whole class
+        cls.config_patcher = patch('utils.config')
+        cls.mock_config = cls.config_patcher.start()
 
+        # Bot and database mocks are specced so misspelled methods fail, and reset per test
+        cls.mock_bot = AsyncMock(spec=Bot)
+        cls.mock_db = MagicMock(spec=MessageDatabase)
 
-class TestUtils(unittest.TestCase):
-    """Test cases for utility functions."""
+    @classmethod
+    def tearDownClass(cls):
+        """Clean up test environment."""
+        cls.config_patcher.stop()
+        # Leave test-mode logging configured from the real config for the following test modules
+        _reset_logging_for_tests()
+        setup_logging()
 
     def setUp(self):
-        """Set up test environment."""
-        # Create temporary log file
-        self.temp_log = tempfile.NamedTemporaryFile(delete=False, suffix='.log')
-        self.temp_log.close()
-
-        # Mock config values
-        self.config_patcher = patch('utils.config')
-        self.mock_config = self.config_patcher.start()
+        """Reset mocks and config values to their defaults."""
+        self.mock_bot.reset_mock(return_value=True, side_effect=True)
+        self.mock_db.reset_mock(return_value=True, side_effect=True)
+        self.mock_config.reset_mock()
         self.mock_config.LOG_LEVEL = 'INFO'
-        self.mock_config.LOG_FILE = self.temp_log.name
+        self.mock_config.LOG_FILE = os.devnull
+        self.mock_config.LOG_MAX_BYTES = 1024 * 1024
+        self.mock_config.LOG_BACKUP_COUNT = 1
         self.mock_config.USER_ID = '12345'
         self.mock_config.USER_USERNAME = None
 
     def tearDown(self):
-        """Clean up test environment."""
-        # Remove temporary log file
-        os.unlink(self.temp_log.name)
-        self.config_patcher.stop()
+        """Close handlers installed by the test and restore test-mode logging."""
+        _reset_logging_for_tests()
+        setup_logging()
 
     def test_setup_logging(self):
         """Test logging setup."""
+        _reset_logging_for_tests()
         logger = setup_logging()
         self.assertIsNotNone(logger)
         self.assertEqual(logger.level, 20)  # INFO level
 
     def test_setup_logging_with_custom_level(self):
         """Test logging setup with custom level."""
+        _reset_logging_for_tests()
         self.mock_config.LOG_LEVEL = 'DEBUG'
         logger = setup_logging()
         self.assertEqual(logger.level, 10)  # DEBUG level
 
-    @patch('utils.config.USER_ID', '12345')
-    @patch('utils.config.USER_USERNAME', None)
-    def test_send_deletion_notification_success(self):
-        """Test sending success notification."""
-        # Mock bot
-        mock_bot = AsyncMock()
-
-        # Test success notification using asyncio.run
-        import asyncio
-        asyncio.run(send_deletion_notification(mock_bot, 123, 456, True))
-
-        # Verify bot.send_message was called
-        mock_bot.send_message.assert_called_once()
-        call_args = mock_bot.send_message.call_args
-        self.assertEqual(call_args[1]['chat_id'], '12345')
-        self.assertIn('✅ **Message Deleted Successfully**', call_args[1]['text'])
-
-    @patch('utils.config.USER_ID', None)
-    @patch('utils.config.USER_USERNAME', 'testuser')
-    def test_send_deletion_notification_with_username(self):
-        """Test sending notification using username."""
-        # Mock bot
-        mock_bot = AsyncMock()
-
-        # Test failure notification using asyncio.run
-        import asyncio
-        asyncio.run(send_deletion_notification(mock_bot, 123, 456, False, "Test error"))
-
-        # Verify bot.send_message was called with username
-        mock_bot.send_message.assert_called_once()
-        call_args = mock_bot.send_message.call_args
-        self.assertEqual(call_args[1]['chat_id'], '@testuser')
-        self.assertIn('❌ **Message Deletion Failed**', call_args[1]['text'])
-
-    @patch('utils.config.USER_ID', None)
-    @patch('utils.config.USER_USERNAME', None)
-    def test_send_deletion_notification_no_user(self):
-        """Test notification when no user is configured."""
-        # Mock bot
-        mock_bot = AsyncMock()
-
-        # Test notification (should not send anything) using asyncio.run
-        import asyncio
-        asyncio.run(send_deletion_notification(mock_bot, 123, 456, True))
-
-        # Verify bot.send_message was not called
-        mock_bot.send_message.assert_not_called()
-
-    def test_delete_message_notify_success(self):
+    def test_setup_logging_is_idempotent(self):
+        """Test repeated setup does not stack handlers."""
+        _reset_logging_for_tests()
+        logger = setup_logging()
+        self.assertIs(setup_logging(), logger)
+        self.assertEqual(len(logger.handlers), 1)
+
+    def test_setup_logging_test_mode(self):
+        """Test records are discarded in test mode and queued for the listener otherwise."""
+        _reset_logging_for_tests()
+        logger = setup_logging()
+        self.assertIsInstance(logger.handlers[0], logging.NullHandler)
+        self.assertFalse(logger.propagate)
+        _reset_logging_for_tests()
+
+        with patch.dict(os.environ):
+            del os.environ['AUTODELETE_TEST_MODE']
+            self.assertIsInstance(setup_logging().handlers[0], QueueHandler)
+
+    def test_get_notify_user(self):
+        """Test the notification target is USER_ID, else @USER_USERNAME, else None."""
+        self.assertEqual(get_notify_user(), '12345')
+
+        self.mock_config.USER_ID = None
+        self.mock_config.USER_USERNAME = 'testuser'
+        self.assertEqual(get_notify_user(), '@testuser')
+
+        self.mock_config.USER_USERNAME = None
+        self.assertIsNone(get_notify_user())
+
+    async def test_send_deletion_notification(self):
+        """Test the notification is sent as HTML to the given chat, and not at all without one."""
+        text = format_deletion_notification(123, 456)
+        cases = {
+            # case name: (notify_user, expected send_message calls)
+            "user id": ('12345', [call(chat_id='12345', text=text, parse_mode='HTML')]),
+            "username": ('@testuser', [call(chat_id='@testuser', text=text, parse_mode='HTML')]),
+            "no user": (None, []),
+        }
+        for case, (notify_user, expected_calls) in cases.items():
+            with self.subTest(case):
+                self.mock_bot.reset_mock()
+
+                await send_deletion_notification(self.mock_bot, notify_user, text)
+
+                self.assertEqual(self.mock_bot.send_message.call_args_list, expected_calls)
+
+    async def test_send_deletion_notification_send_error(self):
+        """Test a failed request is logged rather than raised."""
+        self.mock_bot.send_message.side_effect = NetworkError("Bot error")
+
+        with self.assertLogs('utils', 'ERROR') as logs:
+            await send_deletion_notification(self.mock_bot, '12345', format_deletion_notification(123, 456))
+
+        self.assertIn("Failed to send deletion notification: Bot error", logs.output[0])
+
+    def test_format_deletion_notification_failure(self):
+        """Test a failed deletion shows the error instead of the success heading."""
+        text = format_deletion_notification(123, 456, "Test error")
+
+        self.assertIn('<b>Error:</b> Test error', text)
+        self.assertNotIn('✅ Message Deleted Successfully', text)
+
+    def test_format_deletion_notification_escapes_error(self):
+        """Test error messages cannot inject HTML into the notification."""
+        text = format_deletion_notification(123, 456, "Bad <b> & co")
+
+        self.assertIn('<b>Error:</b> Bad &lt;b&gt; &amp; co', text)
+
+    async def test_send_deletion_notification_propagates_bugs(self):
+        """Test only request errors are swallowed by the notification."""
+        self.mock_bot.send_message.side_effect = ValueError("bad argument")
+
+        with self.assertRaises(ValueError):
+            await send_deletion_notification(self.mock_bot, '12345', format_deletion_notification(123, 456))
+
+    async def test_background_notification_errors_are_logged(self):
+        """Test a notification task that fails is logged rather than left unretrieved."""
+        self.mock_db.delete_message_record.return_value = True
+        self.mock_bot.send_message.side_effect = ValueError("bad argument")
+
+        with self.assertLogs('utils', 'ERROR') as logs:
+            success, _ = await delete_message_notify(self.mock_bot, self.mock_db, '12345', (123, 456, 789, None))
+            await wait_for_notifications()
+
+        self.assertTrue(success)
+        self.assertIn("Notification task failed: ValueError('bad argument')", logs.output[0])
+
+    @patch('utils._timestamp', return_value='2024-03-05 07:08:09')
+    async def test_notification_texts(self, _mock_timestamp):
+        """Test complete notification texts against their snapshots."""
+        self.assertEqual(format_deletion_notification(123, 456), SUCCESS_SNAPSHOT)
+        self.assertEqual(format_deletion_notification(123, 456, "Message <123> not found"), FAILURE_SNAPSHOT)
+
+        self.assertEqual(format_summary([(1, 10), (2, 10)], [(3, 10, "Bot error")]), SUMMARY_SNAPSHOT)
+
+    @patch('utils.time.localtime', return_value=time.struct_time((2024, 3, 5, 7, 8, 9, 1, 65, 0)))
+    def test_timestamp_format(self, _mock_localtime):
+        """Test notification timestamps are zero-padded local times."""
+        self.assertEqual(_timestamp(), '2024-03-05 07:08:09')
+
+    def test_format_deletion_notification_deleted_at(self):
+        """Test the notification shows the deletion time passed by the caller."""
+        deleted_at = time.mktime((2024, 3, 5, 7, 8, 9, 0, 0, -1))
+
+        text = format_deletion_notification(123, 456, deleted_at=deleted_at)
+
+        self.assertIn('<b>Deleted at:</b> 2024-03-05 07:08:09', text)
+
+    async def test_delete_message_notify_success(self):
         """Test successful message deletion with notification."""
-        # Mock bot and database
-        mock_bot = AsyncMock()
-        mock_db = MagicMock()
-        mock_db.delete_message_record.return_value = True
+        self.mock_db.delete_message_record.return_value = True
 
-        # Test successful deletion using asyncio.run
-        import asyncio
-        success, error_msg = asyncio.run(delete_message_notify(mock_bot, mock_db, 123, 456, 789))
+        # Test successful deletion
+        success, error_msg = await delete_message_notify(self.mock_bot, self.mock_db, '12345', (123, 456, 789, None))
+        await wait_for_notifications()
 
         # Verify results
         self.assertTrue(success)
         self.assertIsNone(error_msg)
 
         # Verify bot.delete_message was called
-        mock_bot.delete_message.assert_called_once_with(chat_id=456, message_id=123)
+        self.mock_bot.delete_message.assert_called_once_with(chat_id=456, message_id=123)
 
         # Verify database.delete_message_record was called
-        mock_db.delete_message_record.assert_called_once_with(789)
+        self.mock_db.delete_message_record.assert_called_once_with(789, None)
+
+        # Verify the success notification was sent
+        self.mock_bot.send_message.assert_called_once()
+
+    async def test_delete_message_notify_deleted_at(self):
+        """Test the notification shows the time of the deletion attempt, not of sending."""
+        self.mock_db.delete_message_record.return_value = True
+        attempted_at = time.mktime((2024, 3, 5, 7, 8, 9, 0, 0, -1))
+
+        with patch('utils.time.time', return_value=attempted_at):
+            await delete_message_notify(self.mock_bot, self.mock_db, '12345', (123, 456, 789, None))
+        await wait_for_notifications()
 
-    def test_delete_message_notify_db_failure(self):
+        self.assertIn('<b>Deleted at:</b> 2024-03-05 07:08:09', self.mock_bot.send_message.call_args[1]['text'])
+
+    @patch('utils._notify_in_background')
+    @patch('utils.format_deletion_notification')
+    async def test_delete_message_notify_no_user(self, mock_format, mock_notify):
+        """Test no text is built and no task created without a notification target."""
+        self.mock_db.delete_message_record.return_value = True
+
+        success, _ = await delete_message_notify(self.mock_bot, self.mock_db, None, (123, 456, 789, None))
+        self.mock_bot.delete_message.side_effect = Exception("Bot error")
+        failed, _ = await delete_message_notify(self.mock_bot, self.mock_db, None, (123, 456, 789, None))
+
+        self.assertEqual((success, failed), (True, False))
+        mock_format.assert_not_called()
+        mock_notify.assert_not_called()
+
+    async def test_delete_message_notify_db_failure(self):
         """Test message deletion when database operation fails."""
-        # Mock bot and database
-        mock_bot = AsyncMock()
-        mock_db = MagicMock()
-        mock_db.delete_message_record.return_value = False
+        self.mock_db.delete_message_record.return_value = False
 
-        # Test database failure using asyncio.run
-        import asyncio
-        success, error_msg = asyncio.run(delete_message_notify(mock_bot, mock_db, 123, 456, 789))
+        # Test database failure
+        success, error_msg = await delete_message_notify(self.mock_bot, self.mock_db, '12345', (123, 456, 789, None))
 
         # Verify results
         self.assertFalse(success)
         self.assertEqual(error_msg, "Failed to remove record from database")
 
         # Verify bot.delete_message was still called
-        mock_bot.delete_message.assert_called_once_with(chat_id=456, message_id=123)
+        self.mock_bot.delete_message.assert_called_once_with(chat_id=456, message_id=123)
 
-    def test_delete_message_notify_bot_failure(self):
+    async def test_delete_message_notify_bot_failure(self):
         """Test message deletion when bot operation fails."""
-        # Mock bot and database
-        mock_bot = AsyncMock()
-        mock_bot.delete_message.side_effect = Exception("Bot error")
-        mock_db = MagicMock()
+        self.mock_bot.delete_message.side_effect = Exception("Bot error")
 
-        # Test bot failure using asyncio.run
-        import asyncio
-        success, error_msg = asyncio.run(delete_message_notify(mock_bot, mock_db, 123, 456, 789))
+        # Test bot failure
+        success, error_msg = await delete_message_notify(self.mock_bot, self.mock_db, '12345', (123, 456, 789, None))
+        await wait_for_notifications()
 
         # Verify results
         self.assertFalse(success)
         self.assertEqual(error_msg, "Bot error")
 
+        # Verify the failure notification was sent
+        self.assertIn("Bot error", self.mock_bot.send_message.call_args[1]['text'])
+
         # Verify database.delete_message_record was not called
-        mock_db.delete_message_record.assert_not_called()
-
-    def test_send_deletion_notification_exception_handling(self):
-        """Test exception handling in notification function."""
-        # Mock bot that raises exception
-        mock_bot = AsyncMock()
-        mock_bot.send_message.side_effect = Exception("Bot error")
-
-        # This should not raise an exception
-        try:
-            import asyncio
-            asyncio.run(send_deletion_notification(mock_bot, 123, 456, True))
-        except Exception as e:
-            self.fail(f"send_deletion_notification raised an exception: {e}")
+        self.mock_db.delete_message_record.assert_not_called()
+
+    async def test_purge_expired_messages(self):
+        """Test a rejected bulk delete falls back to single deletes and keeps failures."""
+        self.mock_bot.delete_messages.side_effect = BadRequest("Message can't be deleted")
+        self.mock_bot.delete_message.side_effect = [None, Exception("Bot error"), None]
+        rows = [(1, 10, 100), (2, 10, 101), (3, 10, 102)]
+        self.mock_db.iter_messages_to_delete.return_value = iter([rows])
+
+        deleted_count, failed_count = await purge_expired_messages(self.mock_bot, self.mock_db, '12345')
+        await wait_for_notifications()
+
+        self.assertEqual((deleted_count, failed_count), (2, 1))
+        self.mock_bot.delete_messages.assert_called_once_with(chat_id=10, message_ids=[1, 2, 3])
+        self.assertEqual(self.mock_bot.delete_message.call_count, 3)
+        self.mock_db.delete_message_records.assert_called_once_with([100, 102])
+
+        # A single summary notification is sent for the whole batch
+        self.mock_bot.send_message.assert_called_once()
+        text = self.mock_bot.send_message.call_args[1]['text']
+        self.assertIn('<b>✅ Deleted:</b> 2 messages', text)
+        self.assertIn('• 2 in 10: Bot error', text)
+
+    @patch('utils._notify_in_background')
+    async def test_purge_expired_messages_no_user(self, mock_notify):
+        """Test no summary task is created without a notification target."""
+        self.mock_db.iter_messages_to_delete.return_value = iter([[(1, 10, 100)]])
+
+        self.assertEqual(await purge_expired_messages(self.mock_bot, self.mock_db, None), (1, 0))
+
+        mock_notify.assert_not_called()
+
+    async def test_purge_expired_messages_bulk(self):
+        """Test expired messages are deleted page by page, in one bulk call per chat."""
+        rows = [(i, 10, 1000 + i) for i in range(150)] + [(1, 20, 2000)]
+        self.mock_db.iter_messages_to_delete.return_value = iter([rows[:100], rows[100:]])
+
+        deleted_count, failed_count = await purge_expired_messages(self.mock_bot, self.mock_db, '12345')
+
+        self.assertEqual((deleted_count, failed_count), (151, 0))
+        self.assertEqual(self.mock_bot.delete_messages.call_count, 3)
+        self.mock_bot.delete_messages.assert_any_call(chat_id=10, message_ids=list(range(100)))
+        self.mock_bot.delete_messages.assert_any_call(chat_id=10, message_ids=list(range(100, 150)))
+        self.mock_bot.delete_messages.assert_any_call(chat_id=20, message_ids=[1])
+        self.mock_bot.delete_message.assert_not_called()
+        self.mock_db.iter_messages_to_delete.assert_called_once_with(100)
+        self.assertEqual(self.mock_db.delete_message_records.call_args_list, [
+            call([row[2] for row in rows[:100]]),
+            call([row[2] for row in rows[100:]]),
+        ])
+
+    def test_format_summary_truncates_failures(self):
+        """Test summary lists a bounded number of failures."""
+        failed = [(i, 10, "error") for i in range(25)]
+        text = format_summary([], failed)
+
+        self.assertIn('<b>❌ Failed:</b> 25 messages', text)
+        self.assertIn('• 19 in 10: error', text)
+        self.assertNotIn('• 20 in 10: error', text)
+        self.assertIn('... and 5 more', text)
+
+    def test_format_summary_escapes_errors(self):
+        """Test error messages cannot inject HTML into the summary."""
+        text = format_summary([], [(1, 10, "Can't parse <entity> & more")])
+
+        self.assertIn('• 1 in 10: Can&#x27;t parse &lt;entity&gt; &amp; more', text)
 
 
 if __name__ == '__main__':
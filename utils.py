@@ -1,86 +1,230 @@
 """Shared utilities for the Auto-Delete Telegram Bot."""
 
+import asyncio
+import atexit
+import html
 import logging
-from datetime import datetime
+import os
+import queue
+import time
+from collections import defaultdict
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import TYPE_CHECKING
 import config
 
+# python-telegram-bot is imported where it is used, so importing this module stays cheap
+if TYPE_CHECKING:
+    from telegram.ext import AIORateLimiter
+
+# HTTP keep-alive connections to the Bot API shared by concurrent requests
+CONNECTION_POOL_SIZE = 32
+
+# Delete requests in flight at once, kept below the pool size so requests never wait for a connection
+MAX_CONCURRENT_DELETIONS = 20
+
+# Maximum number of message ids Telegram accepts in one deleteMessages call.
+# The rate limiter's group limit (20 per minute) covers every request to the channel, deletes
+# included: bulk calls keep a sweep at 100 messages per request, while the one-by-one fallback
+# and scheduled single deletions run at 20 messages per minute, about 5 minutes per full chunk.
+MAX_DELETE_BATCH = 100
+
+# Number of failures listed in a summary notification, keeps it under Telegram's 4096 chars
+MAX_SUMMARY_FAILURES = 20
+
+# Notification texts, filled in with str.format_map() on every send.
+# Sent with parse_mode='HTML'; values that may contain <, > or & are escaped with html.escape()
+SUCCESS_TEMPLATE = (
+    "<b>✅ Message Deleted Successfully</b>\n\n"
+    "<b>Message ID:</b> {message_id}\n"
+    "<b>Channel ID:</b> {chat_id}\n"
+    "<b>Deleted at:</b> {timestamp}"
+)
+FAILURE_TEMPLATE = (
+    "<b>❌ Message Deletion Failed</b>\n\n"
+    "<b>Message ID:</b> {message_id}\n"
+    "<b>Channel ID:</b> {chat_id}\n"
+    "<b>Error:</b> {error_msg}\n"
+    "<b>Time:</b> {timestamp}"
+)
+
+# Application logger; setup_logging() attaches its handlers
+logger = logging.getLogger(__name__)
+
+# Listener started by setup_logging(), None until logging is configured
+_log_listener = None
+
+# Notifications sent in the background, referenced until done so they are not garbage collected
+_pending_notifications = set()
+
+
+def create_rate_limiter() -> 'AIORateLimiter':
+    """Create a rate limiter matching Telegram's limits (30 msg/s overall, 20 msg/min per group).
+
+    AIORateLimiter applies the group limit to every request with a negative or @username chat id,
+    so deletions in the channel are paced at 20 per minute as well, see MAX_DELETE_BATCH.
+    """
+    from telegram.ext import AIORateLimiter
+
+    return AIORateLimiter(
+        overall_max_rate=30,
+        overall_time_period=1,
+        group_max_rate=20,
+        group_time_period=60,
+        max_retries=3
+    )
+
 
 def setup_logging():
-    """Configure logging for the application."""
+    """Configure logging for the application.
+
+    Only the first call installs handlers; later calls return the configured logger.
+    With AUTODELETE_TEST_MODE set, records are discarded instead of written to the log file and console,
+    and not passed on to the root logger either.
+    """
+    global _log_listener
+
+    if logger.handlers:
+        return logger
+
+    logger.setLevel(getattr(logging, config.LOG_LEVEL, logging.INFO))
+
+    if os.getenv('AUTODELETE_TEST_MODE'):
+        logger.addHandler(logging.NullHandler())
+        logger.propagate = False
+        return logger
+
     # Create formatter
     formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
     # Create handlers
-    file_handler = logging.FileHandler(config.LOG_FILE)
+    file_handler = RotatingFileHandler(
+        config.LOG_FILE, maxBytes=config.LOG_MAX_BYTES, backupCount=config.LOG_BACKUP_COUNT, delay=True
+    )
     file_handler.setFormatter(formatter)
 
     stream_handler = logging.StreamHandler()
     stream_handler.setFormatter(formatter)
 
-    # Configure logger
-    logger = logging.getLogger(__name__)
-    logger.setLevel(getattr(logging, config.LOG_LEVEL))
-    logger.addHandler(file_handler)
-    logger.addHandler(stream_handler)
+    # Records are only enqueued by the caller; a background thread does the file and console I/O
+    log_queue = queue.SimpleQueue()
+    _log_listener = QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+
+    logger.addHandler(QueueHandler(log_queue))
 
     return logger
 
 
-async def send_deletion_notification(bot, message_id: int, chat_id: int, success: bool, error_msg: str = None):
-    """Send notification to user about message deletion status."""
-    logger = logging.getLogger(__name__)
+def _reset_logging_for_tests():
+    """Undo setup_logging(), closing its handlers so the next call configures logging again."""
+    global _log_listener
+
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+    logger.propagate = True
+
+    if _log_listener is not None:
+        _log_listener.stop()
+        atexit.unregister(_log_listener.stop)
+        for handler in _log_listener.handlers:
+            handler.close()
+        _log_listener = None
+
+
+def _timestamp(epoch: float = None) -> str:
+    """Return epoch seconds (default: now) as local YYYY-MM-DD HH:MM:SS for notification texts."""
+    ts = time.localtime(epoch)
+    return f"{ts.tm_year:04d}-{ts.tm_mon:02d}-{ts.tm_mday:02d} {ts.tm_hour:02d}:{ts.tm_min:02d}:{ts.tm_sec:02d}"
+
+
+def get_notify_user():
+    """Return the chat to send deletion notifications to, or None if not configured."""
+    if config.USER_ID:
+        return config.USER_ID
+    if config.USER_USERNAME:
+        return f"@{config.USER_USERNAME}"
+    return None
+
+
+def _notify_in_background(coro) -> asyncio.Task:
+    """Send a notification in a task of its own so the caller does not wait for it."""
+    task = asyncio.create_task(coro)
+    _pending_notifications.add(task)
+    task.add_done_callback(_notification_done)
+    return task
+
+
+def _notification_done(task: asyncio.Task):
+    """Forget a finished notification task and log an error nobody awaited."""
+    _pending_notifications.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Notification task failed: %r", task.exception())
+
+
+async def wait_for_notifications():
+    """Wait for notifications still being sent in the background."""
+    if _pending_notifications:
+        await asyncio.gather(*_pending_notifications, return_exceptions=True)
+
+
+def format_deletion_notification(message_id: int, chat_id: int, error_msg: str = None, deleted_at: float = None) -> str:
+    """Build the HTML notification text for one deletion attempt.
+
+    error_msg is None for a successful deletion. deleted_at is the time of the attempt
+    in epoch seconds, now if not given.
+    """
+    template = SUCCESS_TEMPLATE if error_msg is None else FAILURE_TEMPLATE
+    return template.format_map({
+        'message_id': message_id,
+        'chat_id': chat_id,
+        'error_msg': html.escape(str(error_msg)),
+        'timestamp': _timestamp(deleted_at),
+    })
+
 
+async def send_deletion_notification(bot, notify_user, text: str):
+    """Send a deletion notification text to the chat resolved by the caller with get_notify_user()."""
+    # Nothing to do without a target; the missing configuration is reported once at startup
+    if not notify_user:
+        return
+
+    from telegram.error import TelegramError
+
+    # Only the request itself can fail; anything else is a bug and is not swallowed
     try:
-        # Determine who to notify
-        notify_user = None
-        if config.USER_ID:
-            notify_user = config.USER_ID
-        elif config.USER_USERNAME:
-            notify_user = f"@{config.USER_USERNAME}"
-
-        if not notify_user:
-            logger.warning("No user configured for deletion notifications")
-            return
-
-        # Create notification message
-        if success:
-            notification_text = f"✅ **Message Deleted Successfully**\n\n" \
-                              f"**Message ID:** {message_id}\n" \
-                              f"**Channel ID:** {chat_id}\n" \
-                              f"**Deleted at:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-        else:
-            notification_text = f"❌ **Message Deletion Failed**\n\n" \
-                              f"**Message ID:** {message_id}\n" \
-                              f"**Channel ID:** {chat_id}\n" \
-                              f"**Error:** {error_msg}\n" \
-                              f"**Time:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-
-        # Send notification
         await bot.send_message(
             chat_id=notify_user,
-            text=notification_text,
-            parse_mode='Markdown'
+            text=text,
+            parse_mode='HTML'
         )
-        logger.info("Deletion notification sent to %s", notify_user)
-
-    except Exception as e:
+    except (TelegramError, ConnectionError) as e:
         logger.error("Failed to send deletion notification: %s", e)
+        return
+    logger.info("Deletion notification sent to %s", notify_user)
 
 
-async def delete_message_notify(bot, db, message_id: int, chat_id: int, record_id: int):
-    """Handle message deletion and send appropriate notifications."""
-    logger = logging.getLogger(__name__)
+async def delete_message_notify(bot, db, notify_user, record: tuple):
+    """Handle message deletion and send appropriate notifications.
 
+    record is (message_id, chat_id, record_id, delete_date); with a delete_date the database
+    record is matched on its full (delete_date, id) key, with None on its id alone.
+    """
+    message_id, chat_id, record_id, delete_date = record
     try:
         # Delete the message from the channel
         await bot.delete_message(chat_id=chat_id, message_id=message_id)
 
         # Remove the record from database
-        if db.delete_message_record(record_id):
+        if await asyncio.to_thread(db.delete_message_record, record_id, delete_date):
             logger.info("Successfully deleted message %s from channel %s", message_id, chat_id)
 
-            # Send success notification to user
-            await send_deletion_notification(bot, message_id, chat_id, success=True)
+            # Send success notification to user; no text or task without a target
+            if notify_user:
+                _notify_in_background(send_deletion_notification(
+                    bot, notify_user, format_deletion_notification(message_id, chat_id, deleted_at=time.time())
+                ))
             return True, None
 
         error_msg = "Failed to remove record from database"
@@ -92,5 +236,132 @@ async def delete_message_notify(bot, db, message_id: int, chat_id: int, record_i
         logger.error("Error deleting message %s: %s", message_id, error_msg)
 
         # Send failure notification to user
-        await send_deletion_notification(bot, message_id, chat_id, success=False, error_msg=error_msg)
+        if notify_user:
+            _notify_in_background(send_deletion_notification(
+                bot, notify_user, format_deletion_notification(message_id, chat_id, error_msg, time.time())
+            ))
         return False, error_msg
+
+
+def format_summary(deleted: list, failed: list) -> str:
+    """Build one HTML notification text for a batch of deletions.
+
+    deleted holds (message_id, chat_id) pairs, failed holds (message_id, chat_id, error_msg).
+    """
+    lines = [
+        "<b>🧹 Cleanup Summary</b>",
+        "",
+        f"<b>✅ Deleted:</b> {len(deleted)} messages",
+        f"<b>❌ Failed:</b> {len(failed)} messages",
+    ]
+    for message_id, chat_id, error_msg in failed[:MAX_SUMMARY_FAILURES]:
+        lines.append(f"• {message_id} in {chat_id}: {html.escape(error_msg)}")
+    if len(failed) > MAX_SUMMARY_FAILURES:
+        lines.append(f"... and {len(failed) - MAX_SUMMARY_FAILURES} more")
+    lines.append(f"<b>Time:</b> {_timestamp()}")
+    return "\n".join(lines)
+
+
+async def send_summary_notification(bot, notify_user, deleted: list, failed: list):
+    """Send a single notification summarising a batch of deletions."""
+    if not notify_user:
+        return
+
+    from telegram.error import TelegramError
+
+    text = format_summary(deleted, failed)
+    try:
+        await bot.send_message(
+            chat_id=notify_user,
+            text=text,
+            parse_mode='HTML'
+        )
+    except (TelegramError, ConnectionError) as e:
+        logger.error("Failed to send cleanup summary: %s", e)
+        return
+    logger.info("Cleanup summary sent to %s", notify_user)
+
+
+async def _delete_chunk(bot, chat_id: int, rows: list, semaphore: asyncio.Semaphore) -> list:
+    """Delete up to MAX_DELETE_BATCH messages of one chat and return an error (or None) per row.
+
+    Falls back to deleting one message at a time if Telegram rejects the bulk request; those
+    requests are held to the channel's group rate limit of 20 per minute.
+    """
+    from telegram.error import BadRequest
+
+    try:
+        async with semaphore:
+            await bot.delete_messages(chat_id=chat_id, message_ids=[row[0] for row in rows])
+        return [None] * len(rows)
+    except BadRequest as e:
+        logger.warning("Bulk delete failed in chat %s, retrying one by one: %s", chat_id, e)
+    except Exception as e:
+        logger.error("Error deleting %s messages in chat %s: %s", len(rows), chat_id, e)
+        return [str(e)] * len(rows)
+
+    async def delete_one(message_id: int):
+        try:
+            async with semaphore:
+                await bot.delete_message(chat_id=chat_id, message_id=message_id)
+            return None
+        except Exception as e:
+            logger.error("Error deleting message %s: %s", message_id, e)
+            return str(e)
+
+    return await asyncio.gather(*(delete_one(row[0]) for row in rows))
+
+
+async def purge_expired_messages(bot, db, notify_user):
+    """Delete all expired messages and return (deleted_count, failed_count).
+
+    Expired records are read in pages of MAX_DELETE_BATCH, so memory stays bounded and the
+    first deletions start without loading the whole backlog. Each page is removed with
+    Telegram's bulk deleteMessages call, grouped by chat. Records of deleted messages are
+    removed from the database in one transaction per page; records whose Telegram deletion
+    fails are kept so they are retried on the next run.
+    The user gets a single summary notification for the whole run, sent in the background.
+    """
+    # Requests are paced by the bot's rate limiter; the semaphore bounds how many are in flight
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_DELETIONS)
+    pages = db.iter_messages_to_delete(MAX_DELETE_BATCH)
+
+    deleted = []
+    failed = []
+    while True:
+        # Database calls run in a worker thread so they don't block the event loop
+        page = await asyncio.to_thread(next, pages, None)
+        if page is None:
+            break
+
+        by_chat = defaultdict(list)
+        for row in page:
+            by_chat[row[1]].append(row)
+        chunks = list(by_chat.items())
+
+        results = await asyncio.gather(
+            *(_delete_chunk(bot, chat_id, rows, semaphore) for chat_id, rows in chunks),
+            return_exceptions=True
+        )
+
+        deleted_ids = []
+        for (_, rows), errors in zip(chunks, results):
+            if isinstance(errors, Exception):
+                errors = [str(errors)] * len(rows)
+            for (message_id, chat_id, record_id), error_msg in zip(rows, errors):
+                if error_msg is None:
+                    deleted.append((message_id, chat_id))
+                    deleted_ids.append(record_id)
+                else:
+                    # If message deletion fails, keep the record for retry
+                    failed.append((message_id, chat_id, error_msg))
+
+        if deleted_ids:
+            await asyncio.to_thread(db.delete_message_records, deleted_ids)
+
+    if not deleted and not failed:
+        return 0, 0
+
+    if notify_user:
+        _notify_in_background(send_summary_notification(bot, notify_user, deleted, failed))
+    return len(deleted), len(failed)